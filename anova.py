@@ -0,0 +1,116 @@
+import streamlit as st
+import numpy as np
+import groupstats
+import ingest
+
+def create_navbar():
+    st.markdown(
+        """
+        <style>
+        body {
+            margin: 0;
+        }
+
+        .navbar {
+            background-color: #317EFB;
+            padding: 10px;
+            width: 100%;
+            position: sticky;
+            top: 0;
+            z-index: 100;
+        }
+
+        .navbar a {
+            color: white;
+            text-decoration: none;
+            margin: 0 15px;
+        }
+
+        .navbar a:hover {
+            text-decoration: underline;
+        }
+        </style>
+        
+        <div class="navbar">
+            <a href="https://sigmastat.org/">Home</a>
+            <a href="https://sigmastat.org/about/about-us.html">About</a>
+            <a href="https://sigmastat.org/contact.html">Contact</a>
+        </div>
+        """,
+        unsafe_allow_html=True,
+    )
+
+def upload_csv_file():
+    return st.sidebar.file_uploader("Upload CSV File", type=["csv"])
+
+def display_spreadsheet(df):
+    st.dataframe(df, height=300)
+    st.write("")  # Add an empty line to separate plots
+
+def select_variables(df):
+    selected_var = st.sidebar.selectbox("Select a Variable for ANOVA", df.columns)
+    group_var = st.sidebar.selectbox("Select a Grouping Column", df.columns)
+    return selected_var, group_var
+
+def perform_anova(uploaded_file, df, selected_var, group_var, test_performed):
+    if st.button("Perform ANOVA") and not test_performed:
+        if selected_var != group_var:
+            # Group counts, means and sums of squares in one streamed pass
+            sums = groupstats.from_chunks(ingest.iter_chunks(uploaded_file, [selected_var, group_var]), selected_var, group_var)
+            if len(sums.n) < 2:
+                st.warning("The grouping column needs at least 2 groups with values.")
+                return False
+
+            values = df[selected_var].to_numpy(dtype=np.float64, na_value=np.nan)
+            results = groupstats.summary_table(sums, values, df[group_var].to_numpy())
+
+            # Display test results
+            st.subheader("ANOVA Results")
+            st.table(results)
+
+            p_value = results.loc["Welch's ANOVA", "p_value"]
+            if p_value < 0.05:
+                st.write(f"The mean of {selected_var} differs significantly between the groups of {group_var}.")
+            else:
+                st.write(f"No significant difference observed in the mean of {selected_var} between the groups of {group_var}.")
+
+            # Display group summary table
+            st.subheader("Group Summary Table")
+            st.dataframe(sums.to_frame(), height=300)
+
+            return True
+        else:
+            st.warning("Please select a grouping column different from the variable.")
+            return False
+    return test_performed
+
+def main():
+    create_navbar()
+
+    st.title("Sigma Stats for ANOVA")
+    st.markdown("---")
+
+    uploaded_file = upload_csv_file()
+
+    if uploaded_file:
+        sample = ingest.read_header(uploaded_file)
+        display_spreadsheet(sample)
+
+        selected_var, group_var = select_variables(sample)
+        df = ingest.read_columns(uploaded_file, list(dict.fromkeys([selected_var, group_var])))
+        st.sidebar.caption(ingest.cache_summary())
+
+        # Track if ANOVA has been performed
+        test_performed = st.session_state.get('test_performed', False)
+
+        if selected_var and group_var:
+            test_performed = perform_anova(uploaded_file, df, selected_var, group_var, test_performed)
+
+            if test_performed:
+                st.success("ANOVA has been performed!")
+
+        # Save the state of test_performed
+        st.session_state.test_performed = test_performed
+
+if __name__ == "__main__":
+    main()
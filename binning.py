@@ -0,0 +1,123 @@
+import math
+
+import numpy as np
+
+import sketches
+
+# Upper bound on the bins of one histogram, whatever the bin rule suggests
+MAX_BINS = 1000
+
+BIN_RULES = ["freedman-diaconis", "sturges"]
+
+# Pie and bar charts show at most TOP_K categories and an "Other" bucket for
+# the rest; columns with more than MAX_CATEGORIES distinct values are
+# treated as continuous and binned instead
+TOP_K = 20
+MAX_CATEGORIES = 100
+
+
+def bin_count(rule, n, low, high, iqr):
+    # Sturges: log2(n) + 1 bins. Freedman-Diaconis: bins of width
+    # 2 IQR / n^(1/3), falling back to Sturges when the IQR is zero.
+    if n == 0 or high <= low:
+        return 1
+    bins = math.ceil(math.log2(n)) + 1
+    if rule == "freedman-diaconis" and iqr > 0:
+        bins = math.ceil((high - low) / (2 * iqr / n ** (1 / 3)))
+    return int(min(max(bins, 1), MAX_BINS))
+
+
+class Histogram:
+    # Counts over fixed, evenly spaced bins (evenly spaced in log10 for log
+    # bins). Each chunk is binned with one vectorised pass and counts from
+    # separate chunks or workers add up exactly.
+
+    def __init__(self, low, high, bins, log=False):
+        self.log = log
+        self._low = low
+        self._width = (high - low) / bins if high > low else 1.0
+        self._edges = np.linspace(low, low + self._width * bins, bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+        # Values a log histogram cannot show (zero or negative)
+        self.dropped = 0
+
+    @property
+    def edges(self):
+        return 10.0 ** self._edges if self.log else self._edges
+
+    def _transform(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if self.log:
+            positive = values > 0
+            self.dropped += int(len(values) - positive.sum())
+            values = np.log10(values[positive])
+        return values
+
+    def index(self, values):
+        # Bin of every value; the maximum falls on the last edge and belongs
+        # to the last bin
+        index = np.floor((values - self._low) / self._width).astype(np.int64)
+        return np.clip(index, 0, len(self.counts) - 1, out=index)
+
+    def update(self, values):
+        self.counts += np.bincount(self.index(self._transform(values)), minlength=len(self.counts))
+        return self
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.dropped += other.dropped
+        return self
+
+
+def histogram_chunks(chunk_source, columns, rule="freedman-diaconis", log=False):
+    # Two streamed passes: quantile sketches give each column's range and
+    # IQR for the bin rule, then every chunk is binned. chunk_source is
+    # called once per pass and must return a fresh iterator of chunks.
+    ranges = {col: sketches.QuantileSketch(seed=0) for col in columns}
+    for chunk in chunk_source():
+        for col in columns:
+            values = chunk[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            if log:
+                values = np.log10(values[values > 0])
+            ranges[col].update(values)
+
+    result = {}
+    for col, sketch in ranges.items():
+        q1, q3 = sketch.quantile([0.25, 0.75]) if sketch.n else (0.0, 0.0)
+        low, high = (sketch.min, sketch.max) if sketch.n else (0.0, 1.0)
+        result[col] = Histogram(low, high, bin_count(rule, sketch.n, low, high, q3 - q1), log)
+
+    for chunk in chunk_source():
+        for col in columns:
+            result[col].update(chunk[col].to_numpy(dtype=np.float64, na_value=np.nan))
+    return result
+
+
+def categorize(values, top_k=TOP_K, max_categories=MAX_CATEGORIES):
+    # Category code of every value (-1 where missing) and the label of each
+    # code. Columns with at most top_k distinct values keep them all; up to
+    # max_categories the top_k most frequent are kept and the rest share an
+    # "Other" code; beyond that the values are binned into at most top_k
+    # evenly spaced bins.
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    codes = np.full(len(values), -1, dtype=np.int64)
+    distinct, inverse, counts = np.unique(values[valid], return_inverse=True, return_counts=True)
+
+    if len(distinct) <= top_k:
+        codes[valid] = inverse.ravel()
+        return codes, [f"{value:g}" for value in distinct]
+
+    if len(distinct) <= max_categories:
+        top = np.argsort(-counts, kind="stable")[:top_k]
+        rank = np.full(len(distinct), top_k, dtype=np.int64)
+        rank[top] = np.arange(top_k)
+        codes[valid] = rank[inverse.ravel()]
+        return codes, [f"{value:g}" for value in distinct[top]] + ["Other"]
+
+    low, high = distinct[0], distinct[-1]
+    histogram = Histogram(low, high, min(bin_count("sturges", len(distinct), low, high, 0), top_k))
+    codes[valid] = histogram.index(values[valid])
+    edges = histogram.edges
+    return codes, [f"[{lo:g}, {hi:g})" for lo, hi in zip(edges[:-2], edges[1:-1])] + [f"[{edges[-2]:g}, {edges[-1]:g}]"]
@@ -1,7 +1,13 @@
 import streamlit as st
-import pandas as pd
-from scipy.stats import ttest_ind, shapiro
-import plotly.express as px
+from pandas.api.types import is_numeric_dtype
+import numpy as np
+import binning
+import downsample
+import executor
+import figures
+import ingest
+import normality
+import ttests
 
 def create_navbar():
     st.markdown(
@@ -63,23 +69,25 @@ def ask_for_charts():
     }
     return {k: v for k, v in charts.items() if v}
 
-def perform_unpaired_t_test(df, selected_vars, test_performed):
+def perform_unpaired_t_test(uploaded_file, df, selected_vars, test_performed):
     if st.button("Perform Unpaired t-test") and not test_performed:
         if len(selected_vars) == 2:
             # Display normality testing before t-test
             st.subheader("Normality Testing")
 
             # Box plot for normality visualization
-            fig = px.box(df, y=selected_vars, labels={var: f"{var} Boxplot" for var in selected_vars})
+            fig = figures.box_figure(executor.map_columns(figures.box_summary, df[selected_vars]))
             st.plotly_chart(fig)
             st.write("")  # Add an empty line to separate plots
 
+            # Normality tests for all variables in one batch
+            normality_results = normality.test_columns(df[selected_vars])
             for var in selected_vars:
                 st.subheader(f"Variable: {var}")
 
-                # Shapiro-Wilk test for normality
-                _, p_value = shapiro(df[var])
-                st.write(f"Shapiro-Wilk p-value for {var}: {p_value}")
+                # Shapiro-Wilk test for normality, from the batch results
+                p_value = normality_results.loc[var, "shapiro_p"]
+                st.write(f"{normality.describe_shapiro(normality_results, var)}: {p_value}")
 
                 # Interpret normality test results
                 if p_value > 0.05:
@@ -87,8 +95,9 @@ def perform_unpaired_t_test(df, selected_vars, test_performed):
                 else:
                     st.write(f"{var} does not appear to be normally distributed.")
 
-            # Perform unpaired t-test
-            result = ttest_ind(df[selected_vars[0]], df[selected_vars[1]], equal_var=False)
+            # Perform unpaired (Welch) t-test from each variable's count,
+            # mean and variance, gathered in one streamed pass
+            result = ttests.two_sample_chunks(ingest.iter_chunks(uploaded_file, selected_vars), selected_vars[0], selected_vars[1])
             
             # Display t-test results
             st.subheader("Unpaired t-test Results")
@@ -111,47 +120,60 @@ def perform_unpaired_t_test(df, selected_vars, test_performed):
             return False
     return test_performed
 
-def plot_charts(df, selected_vars, selected_charts):
+def plot_charts(uploaded_file, df, selected_vars, selected_charts):
+    # Per-variable figures are built across workers, one column each
+    numeric_vars = [var for var in selected_vars if is_numeric_dtype(df[var])]
+
     for chart_type in selected_charts:
         if chart_type == 'Box Plot':
             st.subheader("Box Plot")
-            for var in selected_vars:
-                if df[var].dtype in ['int64', 'float64']:
-                    fig = px.box(df, y=var, labels={var: f"{var} Boxplot"})
-                    st.plotly_chart(fig)
+            for summary in executor.map_columns(figures.box_summary, df[numeric_vars]):
+                st.plotly_chart(figures.box_figure([summary], value_title=f"{summary['name']} Boxplot"))
 
         elif chart_type == 'Histogram':
             st.subheader("Histogram")
-            for var in selected_vars:
-                if df[var].dtype in ['int64', 'float64']:
-                    fig = px.histogram(df, x=var, labels={var: f"{var} Histogram"})
-                    st.plotly_chart(fig)
+
+            # Bins are counted on the server over the cached or streamed
+            # chunks; only edges and counts are sent to the browser
+            rule = st.sidebar.selectbox("Histogram Bins", binning.BIN_RULES)
+            log_bins = st.sidebar.checkbox("Log-scale Bins")
+            histograms = binning.histogram_chunks(lambda: ingest.iter_chunks(uploaded_file, numeric_vars), numeric_vars, rule, log_bins)
+            for var in numeric_vars:
+                st.plotly_chart(figures.histogram_figure(histograms[var], var))
+                if histograms[var].dropped:
+                    st.caption(f"{histograms[var].dropped} values of {var} are not positive and are left out of the log-scale bins.")
 
         elif chart_type == 'Scatter Plot':
             st.subheader("Scatter Plot")
-            fig = px.scatter_matrix(df[selected_vars], labels=df.columns)
+            fig = figures.scatter_matrix_figure(df[selected_vars])
             st.plotly_chart(fig)
 
         elif chart_type == 'Bar Chart':
             st.subheader("Bar Chart")
-            for var in selected_vars:
-                if df[var].dtype in ['int64', 'float64']:
-                    fig = px.bar(df, x=var, y=selected_vars[1], labels={var: f"{var} Bar Chart"})
-                    st.plotly_chart(fig)
+
+            # Bars are summed per category (top values or bins) on the
+            # server rather than drawn from every row
+            y_var = selected_vars[1]
+            y = df[y_var].to_numpy(dtype=np.float64, na_value=np.nan) if is_numeric_dtype(df[y_var]) else None
+            for var in numeric_vars:
+                x = df[var].to_numpy(dtype=np.float64, na_value=np.nan)
+                st.plotly_chart(figures.bar_figure(x, y, var, y_var))
 
         elif chart_type == 'Pie Chart':
             st.subheader("Pie Chart")
-            for var in selected_vars:
-                if df[var].dtype in ['int64', 'float64']:
-                    fig = px.pie(df, names=var, labels={var: f"{var} Pie Chart"})
-                    st.plotly_chart(fig)
+            for fig in executor.map_columns(figures.pie_figure, df[numeric_vars]):
+                st.plotly_chart(fig)
 
         elif chart_type == 'Line Chart':
             st.subheader("Line Chart")
-            for var in selected_vars:
-                if df[var].dtype in ['int64', 'float64']:
-                    fig = px.line(df, x=df.index, y=var, labels={var: f"{var} Line Chart"})
-                    st.plotly_chart(fig)
+
+            # Lines are downsampled on the server; narrowing the window
+            # redraws that stretch of rows with the full point budget
+            points = st.sidebar.number_input("Points per Line", min_value=100, value=downsample.LINE_POINTS, step=100)
+            method = st.sidebar.selectbox("Line Downsampling", ["lttb", "min_max"])
+            window = st.sidebar.slider("Line Chart Rows", 0, len(df), (0, len(df))) if len(df) else (0, 0)
+            for fig in executor.map_columns(figures.line_figure, df[numeric_vars], int(points), window, method):
+                st.plotly_chart(fig)
 
 def main():
     create_navbar()
@@ -162,23 +184,25 @@ def main():
     uploaded_file = upload_csv_file()
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        display_spreadsheet(df)
+        sample = ingest.read_header(uploaded_file)
+        display_spreadsheet(sample)
 
-        selected_vars = select_variables(df)
+        selected_vars = select_variables(sample)
+        df = ingest.read_columns(uploaded_file, selected_vars)
+        st.sidebar.caption(ingest.cache_summary())
         selected_charts = ask_for_charts()
 
         # Track if unpaired t-test has been performed
         test_performed = st.session_state.get('test_performed', False)
 
         if selected_vars:
-            test_performed = perform_unpaired_t_test(df, selected_vars, test_performed)
+            test_performed = perform_unpaired_t_test(uploaded_file, df, selected_vars, test_performed)
 
             if test_performed:
                 st.success("Graphs has been formed!")
 
         if selected_charts:
-            plot_charts(df, selected_vars, selected_charts)
+            plot_charts(uploaded_file, df, selected_vars, selected_charts)
 
         # Save the state of test_performed
         st.session_state.test_performed = test_performed
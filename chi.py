@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from scipy.stats import chi2_contingency
+import contingency
+import ingest
 
 def create_navbar():
     st.markdown(
@@ -40,43 +41,79 @@ def create_navbar():
         unsafe_allow_html=True,
     )
 
+def upload_csv_file():
+    return st.sidebar.file_uploader("Upload CSV File", type=["csv"])
+
+def display_spreadsheet(df):
+    st.dataframe(df, height=300)
+    st.write("")  # Add an empty line to separate plots
+
+def select_variables(df):
+    row_var = st.sidebar.selectbox("Select the Row Variable", df.columns)
+    column_var = st.sidebar.selectbox("Select the Column Variable", df.columns)
+    return row_var, column_var
+
+def observed_values_from_csv(uploaded_file, row_var, column_var):
+    # Sparse crosstab of the two columns and its tests, computed chunk by
+    # chunk once per upload and pair of columns; large tables are listed by
+    # their non-zero cells instead of drawn in full
+    def compute():
+        table = contingency.crosstab_chunks(ingest.iter_chunks(uploaded_file, list(dict.fromkeys([row_var, column_var])), dtype=str), row_var, column_var)
+        return table, contingency.test(table)
+
+    table, result = ingest.cached(uploaded_file, ("crosstab", row_var, column_var), compute)
+    st.subheader("Observed Values")
+    rows, columns = table.shape
+    if rows * columns <= contingency.DENSE_MAX_CELLS:
+        st.dataframe(table.to_frame(), height=300)
+    else:
+        st.caption(f"{rows} x {columns} table with {len(table.counts)} non-zero cells, largest first")
+        st.dataframe(table.cells(), height=300)
+    return table, result
+
 def input_table_size():
     rows = st.number_input("Enter the number of rows:", min_value=1, step=1)
     columns = st.number_input("Enter the number of columns:", min_value=1, step=1)
     return rows, columns
 
 def input_observed_values(rows, columns):
+    # One editable grid instead of a widget per cell; values can be typed
+    # or pasted from a spreadsheet
     st.subheader("Enter Observed Values")
-    data = []
-    for i in range(rows):
-        row_data = []
-        for j in range(columns):
-            value = st.number_input(f"Enter value for row {i+1}, column {j+1}:", min_value=0, step=1)
-            row_data.append(value)
-        data.append(row_data)
-    
-    # Convert to DataFrame for displaying in a table
-    df = pd.DataFrame(data, columns=[f"Column {i+1}" for i in range(columns)])
-    st.dataframe(df, height=150)
-
-    return np.array(data)
-
-def perform_chi_square_test(observed_values):
-    # Perform Chi-square test
+    blank = pd.DataFrame(np.zeros((rows, columns), dtype=np.int64), columns=[f"Column {i+1}" for i in range(columns)])
+    column_config = {col: st.column_config.NumberColumn(min_value=0, step=1) for col in blank.columns}
+    df = st.data_editor(blank, column_config=column_config, key=f"observed_{rows}_{columns}")
+
+    return contingency.Crosstab.from_dense(df.fillna(0).to_numpy(dtype=np.int64), columns=df.columns)
+
+def perform_chi_square_test(observed_values, result, monte_carlo):
+    # Perform Chi-square test from the sparse cells and marginals
     st.subheader("Chi-square Test Results")
-    chi2, p, _, _ = chi2_contingency(observed_values)
-    st.write(f"Chi-square statistic: {chi2}")
+    p = result["chi2_p"]
+    st.write(f"Chi-square statistic: {result['chi2']}")
     st.write(f"P-value: {p}")
+    st.write(f"G-test statistic: {result['g']} (P-value: {result['g_p']})")
+
+    if contingency.needs_monte_carlo(result):
+        st.caption(f"{result['small_expected_share']:.0%} of the expected counts are below {contingency.CHI2_MIN_EXPECTED}; the asymptotic p-values may be unreliable.")
+
+    if monte_carlo:
+        simulated = contingency.monte_carlo_pvalue(observed_values)
+        p = simulated.pvalue
+        st.write(f"Monte-Carlo P-value: {p} ({simulated.resamples} simulated tables)")
 
     if p < 0.05:
         st.write("The observed values are significantly different from the expected values.")
     else:
         st.write("No significant difference observed between the observed and expected values.")
 
-    # Display summary statistics
+    # Display summary statistics of the marginal totals
     st.subheader("Summary Statistics")
-    summary_table = pd.DataFrame(observed_values, columns=[f"Column {i+1}" for i in range(observed_values.shape[1])])
-    st.table(summary_table.describe())
+    summary_table = pd.DataFrame({
+        "Row totals": pd.Series(observed_values.row_totals()).describe(),
+        "Column totals": pd.Series(observed_values.column_totals()).describe(),
+    })
+    st.table(summary_table)
 
 def main():
     create_navbar()
@@ -84,15 +121,31 @@ def main():
     st.title("Sigma Stats for Chi-square Test")
     st.markdown("---")
 
-    # Input table size
-    rows, columns = input_table_size()
+    # Observed values come from two columns of an uploaded CSV or are
+    # entered by hand
+    uploaded_file = upload_csv_file()
+
+    if uploaded_file:
+        sample = ingest.read_header(uploaded_file)
+        display_spreadsheet(sample)
+
+        row_var, column_var = select_variables(sample)
+        observed_values, result = observed_values_from_csv(uploaded_file, row_var, column_var)
+        st.sidebar.caption(ingest.cache_summary())
+    else:
+        # Input table size
+        rows, columns = input_table_size()
+
+        # Input observed values
+        observed_values = input_observed_values(int(rows), int(columns))
+        result = contingency.test(observed_values)
 
-    # Input observed values
-    observed_values = input_observed_values(rows, columns)
+    # Simulated p-values are suggested when many expected counts are small
+    monte_carlo = st.sidebar.checkbox("Monte-Carlo P-value", value=bool(contingency.needs_monte_carlo(result)))
 
     # Perform Chi-square test on button click
     if st.button("Perform Analysis"):
-        perform_chi_square_test(observed_values)
+        perform_chi_square_test(observed_values, result, monte_carlo)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_array
+from scipy.stats import chi2, chi2_contingency
+
+import resampling
+
+# Cochran's rule: the asymptotic p-values are doubtful when more than this
+# share of the expected counts is below CHI2_MIN_EXPECTED
+CHI2_MIN_EXPECTED = 5
+SMALL_EXPECTED_MAX_SHARE = 0.2
+
+MONTE_CARLO_MAX_RESAMPLES = 20_000
+
+# Tables with more cells than this are shown as a list of non-zero cells
+DENSE_MAX_CELLS = 10_000
+
+
+class Crosstab:
+    # Counts of every (row category, column category) pair of two columns,
+    # stored sparsely: only non-zero cells are kept, as parallel arrays of
+    # row code, column code and count. Each chunk is factorized and counted
+    # with one np.unique over the combined codes, then merged in; categories
+    # first seen in a later chunk extend the table. Labels are compared as
+    # strings, so a category read as 1 in one chunk and "1" in another is
+    # counted once.
+
+    def __init__(self):
+        self.rows = pd.Index([])
+        self.columns = pd.Index([])
+        self.row_codes = np.empty(0, dtype=np.int64)
+        self.column_codes = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_dense(cls, table, rows=None, columns=None):
+        table = np.asarray(table, dtype=np.int64)
+        result = cls()
+        result.rows = pd.Index(range(table.shape[0]) if rows is None else rows)
+        result.columns = pd.Index(range(table.shape[1]) if columns is None else columns)
+        r, c = np.nonzero(table)
+        result._add(r, c, table[r, c])
+        return result
+
+    @staticmethod
+    def _extend(index, labels):
+        new = labels.difference(index, sort=False) if len(index) else labels
+        return index.append(new) if len(index) else new
+
+    def _add(self, r, c, n):
+        r = np.concatenate([self.row_codes, r])
+        c = np.concatenate([self.column_codes, c])
+        n = np.concatenate([self.counts, n])
+        cells, inverse = np.unique(r * len(self.columns) + c, return_inverse=True)
+        self.counts = np.bincount(inverse.ravel(), weights=n, minlength=len(cells)).astype(np.int64)
+        self.row_codes, self.column_codes = np.divmod(cells, len(self.columns))
+
+    def update(self, row_values, column_values):
+        row_codes, row_labels = pd.factorize(pd.Series(row_values).astype("string"))
+        col_codes, col_labels = pd.factorize(pd.Series(column_values).astype("string"))
+        # Rows missing either category are not counted
+        keep = (row_codes >= 0) & (col_codes >= 0)
+        cells, counts = np.unique(row_codes[keep] * len(col_labels) + col_codes[keep], return_counts=True)
+        r, c = np.divmod(cells, max(len(col_labels), 1))
+
+        # Stored cells are re-keyed when new columns widen the table
+        self.rows = self._extend(self.rows, pd.Index(row_labels))
+        self.columns = self._extend(self.columns, pd.Index(col_labels))
+        self._add(self.rows.get_indexer(row_labels)[r], self.columns.get_indexer(col_labels)[c], counts)
+        return self
+
+    @property
+    def shape(self):
+        return len(self.rows), len(self.columns)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def row_totals(self):
+        return np.bincount(self.row_codes, weights=self.counts, minlength=len(self.rows))
+
+    def column_totals(self):
+        return np.bincount(self.column_codes, weights=self.counts, minlength=len(self.columns))
+
+    def to_sparse(self):
+        return coo_array((self.counts, (self.row_codes, self.column_codes)), shape=self.shape)
+
+    def to_frame(self):
+        return pd.DataFrame(self.to_sparse().toarray(), index=self.rows, columns=self.columns)
+
+    def cells(self):
+        # Non-zero cells in long form, largest first
+        order = np.argsort(-self.counts, kind="stable")
+        return pd.DataFrame({
+            "row": self.rows[self.row_codes[order]],
+            "column": self.columns[self.column_codes[order]],
+            "count": self.counts[order],
+        })
+
+
+def crosstab_chunks(chunks, row, column):
+    result = Crosstab()
+    for chunk in chunks:
+        result.update(chunk[row].to_numpy(), chunk[column].to_numpy())
+    return result
+
+
+def _margins(table):
+    # Row and column totals of the non-empty rows and columns, with every
+    # stored cell re-coded into them; empty rows and columns take no part in
+    # the test
+    row_totals, column_totals = table.row_totals(), table.column_totals()
+    rows, columns = np.flatnonzero(row_totals), np.flatnonzero(column_totals)
+    row_index = np.cumsum(row_totals > 0) - 1
+    column_index = np.cumsum(column_totals > 0) - 1
+    keep = table.counts > 0
+    return (
+        row_totals[rows], column_totals[columns],
+        row_index[table.row_codes[keep]], column_index[table.column_codes[keep]], table.counts[keep].astype(np.float64),
+    )
+
+
+def _statistic(observed, expected, method):
+    # Pearson's X^2 = sum(O^2 / E) - N and G = 2 sum(O ln(O / E)); zero cells
+    # add nothing to either sum, so only the stored cells are visited
+    if method == "g":
+        return 2 * (observed * np.log(observed / expected)).sum()
+    return (observed * observed / expected).sum() - observed.sum()
+
+
+def test(table):
+    # Chi-square and G-test of independence from the sparse cells and the
+    # marginals. 2 x 2 tables get Yates' correction, as chi2_contingency.
+    row_totals, column_totals, r, c, observed = _margins(table)
+    n = observed.sum()
+    dof = max(len(row_totals) - 1, 0) * max(len(column_totals) - 1, 0)
+    expected = row_totals[r] * column_totals[c] / n if n else observed
+    x2 = _statistic(observed, expected, "chi2")
+    g = _statistic(observed, expected, "g")
+    if dof == 1:
+        x2 = chi2_contingency(table.to_frame().loc[table.row_totals() > 0, table.column_totals() > 0].to_numpy())[0]
+
+    # Share of expected counts (zero cells included) below the minimum:
+    # row i has column_total < CHI2_MIN_EXPECTED * n / row_total[i] there
+    small = np.searchsorted(np.sort(column_totals), CHI2_MIN_EXPECTED * n / row_totals, side="left").sum() if n else 0
+    cells = len(row_totals) * len(column_totals)
+    return {
+        "chi2": x2,
+        "chi2_p": chi2.sf(x2, dof) if dof else np.nan,
+        "g": g,
+        "g_p": chi2.sf(g, dof) if dof else np.nan,
+        "dof": dof,
+        "small_expected_share": small / cells if cells else np.nan,
+    }
+
+
+def needs_monte_carlo(result):
+    return result["small_expected_share"] > SMALL_EXPECTED_MAX_SHARE
+
+
+def _simulate_batch(values, task, row_totals, column_totals, observed, method):
+    # Tables with the observed marginals: every observation keeps its row
+    # and the column labels are shuffled among them. A batch of shuffles is
+    # counted with one np.unique over (resample, row, column) keys.
+    seed, size = task
+    rng = np.random.default_rng(seed)
+    n, k, c = len(values), len(row_totals), len(column_totals)
+    rows = np.repeat(np.arange(k), row_totals.astype(np.int64))
+    columns = rng.permuted(np.broadcast_to(values.astype(np.int64), (size, n)), axis=1)
+    keys = (np.arange(size)[:, None] * k + rows) * c + columns
+    cells, counts = np.unique(keys, return_counts=True)
+    resample, cell = np.divmod(cells, k * c)
+    counts = counts.astype(np.float64)
+    expected = row_totals[cell // c] * column_totals[cell % c] / n
+    if method == "g":
+        terms = 2 * counts * np.log(counts / expected)
+    else:
+        terms = counts * counts / expected
+    stats = np.bincount(resample, weights=terms, minlength=size) - (0 if method == "g" else n)
+    return int((stats >= observed * (1 - 1e-9)).sum())
+
+
+def monte_carlo_pvalue(table, method="chi2", alpha=0.05, max_resamples=MONTE_CARLO_MAX_RESAMPLES, seed=0):
+    # Monte-Carlo p-value of X^2 (without Yates' correction) or G over
+    # random tables with the same marginals, drawn in parallel batches and
+    # stopped early once the p-value is settled
+    row_totals, column_totals, r, c, observed = _margins(table)
+    n = observed.sum()
+    if not n or len(row_totals) < 2 or len(column_totals) < 2:
+        return resampling.ResamplingResult(np.nan, np.nan, 0, np.nan)
+    statistic = _statistic(observed, row_totals[r] * column_totals[c] / n, method)
+    # Column of every observation, grouped by row
+    order = np.lexsort((c, r))
+    labels = np.repeat(c[order], observed[order].astype(np.int64)).astype(np.float64)
+    p, done, se = resampling.sequential(_simulate_batch, labels, (row_totals, column_totals, statistic, method), alpha, max_resamples, seed)
+    return resampling.ResamplingResult(statistic, p, done, se)
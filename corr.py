@@ -1,7 +1,9 @@
 import streamlit as st
-import pandas as pd
-from scipy.stats import shapiro
-import plotly.express as px
+import correlation
+import executor
+import figures
+import ingest
+import normality
 
 def create_navbar():
     st.markdown(
@@ -51,10 +53,10 @@ def select_variables(df):
     selected_vars = st.sidebar.multiselect("Select Variables for Correlation Analysis", df.columns)
     return selected_vars
 
-def generate_report(df, selected_vars):
+def generate_report(df, selected_vars, method="pearson"):
     # Display box Plot with heading "Normality Testing"
     st.subheader("Normality Testing")
-    fig = px.box(df, x=selected_vars, title="")
+    fig = figures.box_figure(executor.map_columns(figures.box_summary, df[selected_vars]), orientation="h")
     fig.update_layout(
         showlegend=False,
         margin=dict(l=10, r=10, b=10, t=10),
@@ -69,12 +71,13 @@ def generate_report(df, selected_vars):
     st.write("")  # Add an empty line to separate plots
 
     # Performing normality checks and displaying results
+    normality_results = normality.test_columns(df[selected_vars])
     for var in selected_vars:
         st.subheader(f"Variable: {var}")
 
-        # Perform Shapiro-Wilk test for normality
-        _, p_value = shapiro(df[var])
-        st.write(f"Shapiro-Wilk p-value for {var}: {p_value}")
+        # Shapiro-Wilk test for normality, from the batch results
+        p_value = normality_results.loc[var, "shapiro_p"]
+        st.write(f"{normality.describe_shapiro(normality_results, var)}: {p_value}")
 
         # Interpret normality test results
         if p_value > 0.05:
@@ -82,24 +85,37 @@ def generate_report(df, selected_vars):
         else:
             st.write(f"{var} does not appear to be normally distributed.")
 
+    if len(selected_vars) < 2:
+        st.warning("Please select at least 2 variables for correlation analysis.")
+        return None
+
+    # Every pair at once, with pairwise handling of missing values
+    result = correlation.METHODS[method](df[selected_vars])
+    st.subheader("Correlation Analysis")
+
     # Display scatter plot and correlation coefficient using Plotly
     if len(selected_vars) == 2:
-        st.subheader("Correlation Analysis")
-        correlation_plot = px.scatter(df, x=selected_vars[0], y=selected_vars[1], title="")
+        correlation_plot = figures.scatter_figure(df[selected_vars[0]], df[selected_vars[1]], selected_vars[0], selected_vars[1])
         correlation_plot.update_xaxes(showline=True, linewidth=1, linecolor='black', mirror=True, title_text=selected_vars[0], zeroline=False)
         correlation_plot.update_yaxes(showline=True, linewidth=1, linecolor='black', mirror=True, title_text=selected_vars[1], zeroline=False)
         st.plotly_chart(correlation_plot)
 
-        correlation_coefficient = df[selected_vars[0]].corr(df[selected_vars[1]])
-        st.write(f"Correlation Coefficient: {correlation_coefficient}")
+        correlation_coefficient = result.r.iloc[0, 1]
+        st.write(f"Correlation Coefficient ({method.title()}): {correlation_coefficient}")
+        st.write(f"p-value: {result.p.iloc[0, 1]}")
+        st.write(f"95% Confidence Interval: ({result.low.iloc[0, 1]}, {result.high.iloc[0, 1]})")
         return correlation_coefficient
-    else:
-        st.warning("Please select exactly 2 variables for correlation analysis.")
-        return None
+
+    # Clustered heatmap of the matrix and the pairs ranked by strength
+    st.plotly_chart(figures.correlation_heatmap(result.r, correlation.cluster_order(result.r)))
+    st.dataframe(correlation.pairs(result), height=300)
+    return result.r
 
 def perform_correlation_analysis(df, selected_vars, analysis_performed):
+    # Spearman and Kendall work on ranks and suit heavy-tailed data
+    method = st.sidebar.selectbox("Correlation Method", list(correlation.METHODS))
     if st.button("Perform Correlation Analysis") and not analysis_performed:
-        correlation_coefficient = generate_report(df, selected_vars)
+        correlation_coefficient = generate_report(df, selected_vars, method)
         return True, correlation_coefficient
     return analysis_performed, None
 
@@ -112,22 +128,24 @@ def main():
     uploaded_file = upload_csv_file()
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        display_spreadsheet(df)
+        sample = ingest.read_header(uploaded_file)
+        display_spreadsheet(sample)
 
-        selected_vars = select_variables(df)
+        selected_vars = select_variables(sample)
+        df = ingest.read_columns(uploaded_file, selected_vars)
+        st.sidebar.caption(ingest.cache_summary())
 
         # Track if correlation analysis has been performed
         analysis_performed = st.session_state.get('analysis_performed', False)
 
-        if selected_vars and len(selected_vars) == 2:
+        if selected_vars and len(selected_vars) >= 2:
             analysis_performed, correlation_coefficient = perform_correlation_analysis(df, selected_vars, analysis_performed)
 
             if analysis_performed:
                 st.success("Correlation Analysis has been performed!")
 
-        elif selected_vars and len(selected_vars) != 2:
-            st.warning("Please select exactly 2 variables for correlation analysis.")
+        elif selected_vars:
+            st.warning("Please select at least 2 variables for correlation analysis.")
 
         # Save the state of analysis_performed
         st.session_state.analysis_performed = analysis_performed
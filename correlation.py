@@ -0,0 +1,199 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy.cluster.hierarchy import leaves_list, linkage
+from scipy.spatial.distance import squareform
+from scipy.stats import kendalltau, norm, t
+
+import executor
+
+# Rows per block of the matrix products, bounding the temporary copies to
+# BLOCK_ROWS x columns values
+BLOCK_ROWS = 100_000
+
+Correlation = namedtuple("Correlation", ["r", "p", "low", "high", "n"])
+
+
+def _as_block(block):
+    if isinstance(block, pd.DataFrame):
+        return block.to_numpy(dtype=np.float64, na_value=np.nan), list(block.columns)
+    block = np.asarray(block, dtype=np.float64)
+    return block, list(range(block.shape[1]))
+
+
+def pearson(block, confidence=0.95):
+    # Pearson correlation of every pair of columns. Columns are standardised
+    # once and the matrix comes out of products of row blocks. Without
+    # missing values that is the single product Z'Z; otherwise missing
+    # values are zeroed and the pairwise counts, sums and sums of squares
+    # come from products with the validity mask, so each pair uses exactly
+    # the rows where both columns are present.
+    x, columns = _as_block(block)
+    k = x.shape[1]
+    valid = ~np.isnan(x)
+    complete = valid.all()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nanmean(x, axis=0) if len(x) else np.zeros(k)
+        scale = np.nanstd(x, axis=0) if len(x) else np.ones(k)
+    scale = np.where((scale > 0) & np.isfinite(scale), scale, 1.0)
+
+    xy = np.zeros((k, k))
+    if not complete:
+        n = np.zeros((k, k))
+        sx = np.zeros((k, k))
+        sxx = np.zeros((k, k))
+    for start in range(0, len(x), BLOCK_ROWS):
+        z = (x[start:start + BLOCK_ROWS] - mean) / scale
+        if complete:
+            xy += z.T @ z
+            continue
+        m = valid[start:start + BLOCK_ROWS].astype(np.float64)
+        z = np.where(m > 0, z, 0.0)
+        xy += z.T @ z
+        n += m.T @ m
+        # sx[i, j]: sum of column i over the rows where column j is present
+        sx += z.T @ m
+        sxx += (z * z).T @ m
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if complete:
+            n = np.full((k, k), float(len(x)))
+            sx = np.zeros((k, k))
+            sxx = np.broadcast_to(np.diag(xy)[:, None], (k, k))
+        cov = xy - sx * sx.T / n
+        var_i = sxx - sx * sx / n
+        r = cov / np.sqrt(var_i * var_i.T)
+        r = np.clip(r, -1.0, 1.0)
+        r = np.where(n >= 2, r, np.nan)
+        np.fill_diagonal(r, np.where(np.diag(var_i) > 0, 1.0, np.nan))
+
+        df = n - 2
+        t_stat = r * np.sqrt(df / (1 - r * r))
+        p = np.where(df > 0, 2 * t.sf(np.abs(t_stat), df), np.nan)
+        # Fisher z interval
+        half = norm.ppf(0.5 + confidence / 2) / np.sqrt(n - 3)
+        fz = np.arctanh(r)
+        low = np.where(n > 3, np.tanh(fz - half), np.nan)
+        high = np.where(n > 3, np.tanh(fz + half), np.nan)
+
+    def frame(values):
+        return pd.DataFrame(values, index=columns, columns=columns)
+
+    return Correlation(frame(r), frame(p), frame(low), frame(high), frame(n.astype(np.int64)))
+
+
+def _dense_ranks(values, name=None):
+    # Dense rank of every value (ties share a rank, -1 where missing) and
+    # the number of values holding each rank
+    valid = ~np.isnan(values)
+    codes = np.full(len(values), -1, dtype=np.int64)
+    _, inverse, counts = np.unique(values[valid], return_inverse=True, return_counts=True)
+    codes[valid] = inverse.ravel()
+    return codes, counts
+
+
+def ranks(block):
+    # Dense ranks of every column, computed once per column (across workers
+    # for large blocks) and shared by all the pairs of a rank correlation
+    x, columns = _as_block(block)
+    return columns, executor.map_columns(_dense_ranks, x)
+
+
+def spearman(block, confidence=0.95):
+    # Pearson correlation of the average ranks, with the same t-based
+    # p-values and Fisher z intervals. Ranks are taken over each column's
+    # present values, so with missing values they can differ slightly from
+    # ranking each pair's common rows afresh.
+    columns, column_ranks = ranks(block)
+    average = np.empty((len(column_ranks[0][0]) if column_ranks else 0, len(columns)))
+    for j, (codes, counts) in enumerate(column_ranks):
+        below = np.cumsum(counts) - counts
+        rank = below + (counts + 1) / 2.0
+        average[:, j] = np.where(codes >= 0, rank[np.maximum(codes, 0)] if len(rank) else np.nan, np.nan)
+    return pearson(pd.DataFrame(average, columns=columns), confidence)
+
+
+def _kendall_row(codes, i):
+    # Kendall's tau-b of column i against every later column of a block of
+    # dense ranks (-1 where missing), each pair on the rows where both are
+    # present. scipy's compiled merge-sort count does the O(n log n) work;
+    # the p-value is its normal approximation, with the tie corrections.
+    xi = codes[:, i]
+    row = []
+    for j in range(i + 1, codes.shape[1]):
+        both = (xi >= 0) & (codes[:, j] >= 0)
+        n = int(both.sum())
+        if n < 2:
+            row.append((n, np.nan, np.nan))
+            continue
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = kendalltau(xi[both], codes[both, j], method="asymptotic")
+        row.append((n, result.statistic, result.pvalue))
+    return row
+
+
+def kendall(block, confidence=0.95):
+    # Kendall's tau-b for every pair, each on the rows where both columns
+    # are present. Dense ranks are computed once per column and shared as
+    # one block; the rows of the pair matrix are spread over the executor.
+    # Intervals use Fieller's Fisher z standard error sqrt(0.437 / (n - 4)).
+    columns, column_ranks = ranks(block)
+    k = len(columns)
+    tau = np.full((k, k), np.nan)
+    p = np.full((k, k), np.nan)
+    n = np.zeros((k, k))
+    codes = np.empty((len(column_ranks[0][0]) if column_ranks else 0, k))
+    for i, (column_codes, counts) in enumerate(column_ranks):
+        codes[:, i] = column_codes
+        n[i, i] = (column_codes >= 0).sum()
+        tau[i, i] = 1.0 if len(counts) > 1 else np.nan
+
+    for i, row in enumerate(executor.map_batches(_kendall_row, codes, range(k - 1))):
+        for j, (pair_n, pair_tau, pair_p) in enumerate(row, start=i + 1):
+            n[i, j] = n[j, i] = pair_n
+            tau[i, j] = tau[j, i] = pair_tau
+            p[i, j] = p[j, i] = pair_p
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        half = norm.ppf(0.5 + confidence / 2) * np.sqrt(0.437 / (n - 4))
+        fz = np.arctanh(tau)
+        low = np.where(n > 4, np.tanh(fz - half), np.nan)
+        high = np.where(n > 4, np.tanh(fz + half), np.nan)
+
+    def frame(values):
+        return pd.DataFrame(values, index=columns, columns=columns)
+
+    return Correlation(frame(tau), frame(p), frame(low), frame(high), frame(n.astype(np.int64)))
+
+
+METHODS = {"pearson": pearson, "spearman": spearman, "kendall": kendall}
+
+
+def cluster_order(r):
+    # Columns reordered by average-linkage clustering on 1 - |r|, so that
+    # strongly related columns sit next to each other in a heatmap
+    if len(r) < 3:
+        return list(r.index)
+    distance = 1 - np.abs(np.nan_to_num(r.to_numpy(), nan=0.0))
+    distance = (distance + distance.T) / 2
+    np.fill_diagonal(distance, 0.0)
+    order = leaves_list(linkage(squareform(np.clip(distance, 0, None), checks=False), method="average"))
+    return [r.index[i] for i in order]
+
+
+def pairs(result):
+    # One row per pair of distinct columns, strongest correlation first
+    r = result.r.to_numpy()
+    i, j = np.triu_indices(len(r), 1)
+    table = pd.DataFrame({
+        "variable_1": result.r.index[i],
+        "variable_2": result.r.columns[j],
+        "r": r[i, j],
+        "p_value": result.p.to_numpy()[i, j],
+        "ci_low": result.low.to_numpy()[i, j],
+        "ci_high": result.high.to_numpy()[i, j],
+        "n": result.n.to_numpy()[i, j],
+    })
+    order = np.argsort(-np.abs(table["r"].to_numpy()), kind="stable")
+    return table.iloc[order].reset_index(drop=True)
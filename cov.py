@@ -1,6 +1,8 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+import figures
+import ingest
+import moments
+import shrinkage
 
 def create_navbar():
     st.markdown(
@@ -50,20 +52,53 @@ def select_variables(df):
     selected_vars = st.sidebar.multiselect("Select Variables for Covariance Analysis", df.columns)
     return selected_vars
 
-def generate_report(df, selected_vars):
-    # Display covariance matrix
+def generate_wide_report(uploaded_file, selected_vars, estimator):
+    # Shrinkage estimate for more variables than the sample covariance can
+    # handle; the full matrix goes to disk and only a summary is shown
+    st.subheader("Shrinkage Covariance")
+    df = ingest.read_columns(uploaded_file, selected_vars)
+    packed = shrinkage.shrunk_covariance(df[selected_vars], estimator, ingest.fingerprint(uploaded_file))
+    st.write(f"Shrinkage intensity ({estimator}): {packed.shrinkage}")
+    st.caption(f"Full matrix stored as a float32 upper triangle ({packed.size * 4 / 1024 ** 2:.1f} MB)")
+
+    st.subheader("Strongest Covariances")
+    st.dataframe(packed.strongest(), height=300)
+
+    st.subheader("Covariance Heatmap")
+    st.plotly_chart(figures.matrix_heatmap(packed.downsample(), "covariance"))
+
+def generate_report(uploaded_file, selected_vars):
+    # Display covariance matrix, accumulated chunk by chunk so that it never
+    # needs the full columns in memory. The same pass keeps each column's
+    # count and range for the scatter plot matrix.
     st.subheader("Covariance Matrix")
-    covariance_matrix = df[selected_vars].cov()
-    st.dataframe(covariance_matrix)
-
-    # Display scatter plot matrix
+    covariance = moments.CoMoments(selected_vars)
+    ranges = moments.Moments(selected_vars)
+    for chunk in ingest.iter_chunks(uploaded_file, selected_vars):
+        covariance.update(chunk)
+        ranges.update(chunk)
+    st.dataframe(covariance.to_frame())
+
+    # Display scatter plot matrix. Raw points are only drawn for as many rows
+    # as the figure shows them; above that the binned counts are streamed
+    # over the ranges found above.
     st.subheader("Scatter Plot Matrix")
-    scatter_matrix = px.scatter_matrix(df[selected_vars])
+    if ranges.n.max() <= figures.SCATTER_WEBGL_MAX_ROWS:
+        scatter_matrix = figures.scatter_matrix_figure(ingest.read_columns(uploaded_file, selected_vars)[selected_vars])
+    else:
+        scatter_matrix = figures.binned_scatter_matrix_figure(ingest.iter_chunks(uploaded_file, selected_vars), selected_vars, ranges.min, ranges.max)
     st.plotly_chart(scatter_matrix)
 
-def perform_covariance_analysis(df, selected_vars, analysis_performed):
+def perform_covariance_analysis(uploaded_file, sample, selected_vars, analysis_performed):
+    # The preview sample holds more rows than WIDE_MIN_COLUMNS unless it is
+    # the whole file, so it decides the default as well as the full count
+    wide = st.sidebar.checkbox("Wide-data Mode (Shrinkage)", value=shrinkage.is_wide(len(sample), len(selected_vars)))
+    estimator = st.sidebar.selectbox("Shrinkage Estimator", shrinkage.ESTIMATORS) if wide else None
     if st.button("Perform Covariance Analysis") and not analysis_performed:
-        generate_report(df, selected_vars)
+        if wide:
+            generate_wide_report(uploaded_file, selected_vars, estimator)
+        else:
+            generate_report(uploaded_file, selected_vars)
         return True
     return analysis_performed
 
@@ -76,16 +111,17 @@ def main():
     uploaded_file = upload_csv_file()
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        display_spreadsheet(df)
+        sample = ingest.read_header(uploaded_file)
+        display_spreadsheet(sample)
 
-        selected_vars = select_variables(df)
+        selected_vars = select_variables(sample)
+        st.sidebar.caption(ingest.cache_summary())
 
         # Track if covariance analysis has been performed
         analysis_performed = st.session_state.get('analysis_performed', False)
 
         if selected_vars and len(selected_vars) > 1:
-            analysis_performed = perform_covariance_analysis(df, selected_vars, analysis_performed)
+            analysis_performed = perform_covariance_analysis(uploaded_file, sample, selected_vars, analysis_performed)
 
             if analysis_performed:
                 st.success("Covariance Analysis has been performed!")
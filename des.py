@@ -1,7 +1,10 @@
 import streamlit as st
-import pandas as pd
-from scipy.stats import shapiro, skew, kurtosis
-import plotly.express as px
+import executor
+import figures
+import ingest
+import moments
+import normality
+import sketches
 
 def create_navbar():
     st.markdown(
@@ -51,10 +54,39 @@ def select_variables(df):
     selected_vars = st.sidebar.multiselect("Select Variables for Analysis", df.columns)
     return selected_vars
 
-def generate_report(df, selected_vars):
+def generate_report(uploaded_file, selected_vars, approximate=False):
     # Display box Plot with heading "Normality Testing"
     st.subheader("Normality Testing")
-    fig = px.box(df[selected_vars], title="")
+    # The exact path needs the raw columns, so they are loaded (and cached)
+    # first and the streamed passes below slice them; the approximate path
+    # never holds a whole column
+    if not approximate:
+        df = ingest.read_columns(uploaded_file, selected_vars)
+
+    # Count, mean, spread and shape of every variable in one pass over the
+    # rows. In approximate mode the same pass feeds quantile and frequency
+    # sketches, which give the quartiles, the modes and the box plot instead
+    # of sorting and counting each column.
+    column_moments = moments.Moments(selected_vars)
+    column_sketches = sketches.sketch_columns(selected_vars) if approximate else {}
+    for chunk in ingest.iter_chunks(uploaded_file, selected_vars):
+        column_moments.update(chunk)
+        sketches.update_columns(column_sketches, chunk)
+    summary = column_moments.to_frame()
+
+    # Performing normality checks. Shapiro-Wilk needs the raw values; in
+    # approximate mode the D'Agostino-Pearson test on the streamed moments is
+    # used instead.
+    if approximate:
+        box_summaries = [figures.sketch_box_summary(column_sketches[var].quantiles, var, summary.loc[var, "mean"]) for var in selected_vars]
+        normality_results = normality.moment_tests(column_moments)
+    else:
+        # One shared copy of the columns serves every per-column analysis
+        with executor.SharedBlock(df[selected_vars]) as block:
+            box_summaries = executor.map_columns(figures.box_summary, block)
+            exact = dict(zip(selected_vars, executor.map_columns(sketches.exact_summary, block)))
+            normality_results = normality.test_columns(block)
+    fig = figures.box_figure(box_summaries)
     fig.update_layout(
         showlegend=False,
         margin=dict(l=10, r=10, b=10, t=10),
@@ -68,13 +100,17 @@ def generate_report(df, selected_vars):
     st.plotly_chart(fig)
     st.write("")  # Add an empty line to separate plots
 
-    # Performing normality checks and displaying results
+    # Displaying the normality results
     for var in selected_vars:
         st.subheader(f"Variable: {var}")
 
-        # Perform Shapiro-Wilk test for normality
-        _, p_value = shapiro(df[var])
-        st.write(f"Shapiro-Wilk p-value for {var}: {p_value}")
+        # Test for normality, from the batch results
+        if approximate:
+            p_value = normality_results.loc[var, "dagostino_p"]
+            st.write(f"D'Agostino-Pearson p-value for {var} (streamed): {p_value}")
+        else:
+            p_value = normality_results.loc[var, "shapiro_p"]
+            st.write(f"{normality.describe_shapiro(normality_results, var)}: {p_value}")
 
         # Interpret normality test results
         if p_value > 0.05:
@@ -82,23 +118,41 @@ def generate_report(df, selected_vars):
         else:
             st.write(f"{var} does not appear to be normally distributed.")
 
+        if approximate:
+            q1, q2, q3 = column_sketches[var].quantiles.quantile([0.25, 0.5, 0.75])
+            error = f" (rank error ±{column_sketches[var].quantiles.rank_error:.2%})"
+            mode = column_sketches[var].mode()
+            if mode.interval is not None:
+                mode_text = f"{mode.value} ({mode.method} {mode.interval[0]} to {mode.interval[1]})"
+            else:
+                mode_text = f"{mode.value} ({mode.method})"
+        else:
+            q1, q2, q3, mode_text = exact[var]
+            error = ""
+
         # Display descriptive statistics
         st.subheader("Descriptive Statistics")
-        st.write(f"Mean: {df[var].mean()}")
-        st.write(f"Median: {df[var].median()}")
-        st.write(f"Mode: {df[var].mode().iloc[0]}")
-        st.write(f"Skewness: {skew(df[var])}")
-        st.write(f"Kurtosis: {kurtosis(df[var])}")
-        st.write(f"Standard Deviation: {df[var].std()}")
-        st.write(f"Q1 (25th Percentile): {df[var].quantile(0.25)}")
-        st.write(f"Q2 (50th Percentile - Median): {df[var].quantile(0.5)}")
-        st.write(f"Q3 (75th Percentile): {df[var].quantile(0.75)}")
+        st.write(f"Mean: {summary.loc[var, 'mean']}")
+        st.write(f"Median: {q2}{error}")
+        st.write(f"Mode: {mode_text}")
+        st.write(f"Skewness: {summary.loc[var, 'skewness']}")
+        st.write(f"Kurtosis: {summary.loc[var, 'kurtosis']}")
+        st.write(f"Standard Deviation: {summary.loc[var, 'std']}")
+        st.write(f"Q1 (25th Percentile): {q1}{error}")
+        st.write(f"Q2 (50th Percentile - Median): {q2}{error}")
+        st.write(f"Q3 (75th Percentile): {q3}{error}")
+
+        if approximate:
+            top_values = column_sketches[var].frequencies.top_k(5)
+            if len(top_values):
+                st.write("Most Frequent Values:")
+                st.dataframe(top_values, hide_index=True)
 
         st.write("")  # Add an empty line to separate variables
 
-def perform_analysis(df, selected_vars, analysis_performed):
+def perform_analysis(uploaded_file, selected_vars, analysis_performed, approximate=False):
     if st.button("Perform Analysis") and not analysis_performed:
-        generate_report(df, selected_vars)
+        generate_report(uploaded_file, selected_vars, approximate)
         return True
     return analysis_performed
 
@@ -111,16 +165,18 @@ def main():
     uploaded_file = upload_csv_file()
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        display_spreadsheet(df)
+        sample = ingest.read_header(uploaded_file)
+        display_spreadsheet(sample)
 
-        selected_vars = select_variables(df)
+        selected_vars = select_variables(sample)
+        approximate = st.sidebar.checkbox("Approximate quantiles")
+        st.sidebar.caption(ingest.cache_summary())
 
         # Track if analysis has been performed
         analysis_performed = st.session_state.get('analysis_performed', False)
 
         if selected_vars:
-            analysis_performed = perform_analysis(df, selected_vars, analysis_performed)
+            analysis_performed = perform_analysis(uploaded_file, selected_vars, analysis_performed, approximate)
 
             if analysis_performed:
                 st.success("Analysis has been performed!")
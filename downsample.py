@@ -0,0 +1,61 @@
+import numpy as np
+
+# Points drawn per line series unless the page asks for another budget
+LINE_POINTS = 2000
+
+
+def _drop_missing(x, y):
+    keep = ~np.isnan(y)
+    return x[keep], y[keep]
+
+
+def lttb(x, y, points=LINE_POINTS):
+    # Largest-Triangle-Three-Buckets: the first and last points are kept,
+    # the rest is split into points - 2 buckets, and each bucket keeps the
+    # point forming the largest triangle with the point kept before it and
+    # the mean of the next bucket
+    x, y = _drop_missing(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    n = len(x)
+    if points >= n or points < 3:
+        return x, y
+
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / sizes
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 1 < points - 2:
+            cx, cy = mean_x[i + 1], mean_y[i + 1]
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+def min_max(x, y, points=LINE_POINTS):
+    # Keeps the first and last points plus the lowest and highest point of
+    # each of (points - 2) / 2 buckets, in their original order, so spikes
+    # survive at any zoom level and the line spans the full x range
+    x, y = _drop_missing(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    n = len(x)
+    buckets = (points - 2) // 2
+    if points >= n or buckets < 1:
+        return x, y
+
+    bucket = np.arange(n) * buckets // n
+    starts = np.searchsorted(bucket, np.arange(buckets))
+    selected = [np.array([0, n - 1])]
+    for extreme in (np.minimum, np.maximum):
+        # First position in each bucket that holds the bucket's extreme
+        hits = np.flatnonzero(y == extreme.reduceat(y, starts)[bucket])
+        _, first = np.unique(bucket[hits], return_index=True)
+        selected.append(hits[first])
+    selected = np.unique(np.concatenate(selected))
+    return x[selected], y[selected]
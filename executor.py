@@ -0,0 +1,173 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# "process" spreads columns over a pool of worker processes that read the
+# block from shared memory, "thread" uses a thread pool over the same array
+# (NumPy and SciPy release the GIL in their inner loops), and "serial" runs
+# everything in the calling thread.
+BACKEND = os.environ.get("SIGMASTAT_EXECUTOR", "process")
+WORKERS = int(os.environ.get("SIGMASTAT_WORKERS", os.cpu_count() or 1))
+
+# Blocks smaller than this many values run serially, where starting the
+# work on a pool would cost more than it saves
+PARALLEL_MIN_VALUES = 2_000_000
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(backend):
+    with _pools_lock:
+        if backend not in _pools:
+            if backend == "process":
+                # Spawned rather than forked: the Streamlit server is
+                # multithreaded and forking it is not safe
+                _pools[backend] = ProcessPoolExecutor(WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                _pools[backend] = ThreadPoolExecutor(WORKERS)
+        return _pools[backend]
+
+
+@atexit.register
+def shutdown():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
+
+
+def _columns(block):
+    if isinstance(block, SharedBlock):
+        for j, name in enumerate(block.columns):
+            yield name, block.array[:, j]
+    elif isinstance(block, pd.DataFrame):
+        for name in block.columns:
+            yield name, block[name].to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        block = np.asarray(block, dtype=np.float64)
+        for j in range(block.shape[1]):
+            yield j, block[:, j]
+
+
+def _parallel(shape, backend):
+    return backend != "serial" and shape[0] * shape[1] >= PARALLEL_MIN_VALUES and shape[1] >= 2 and WORKERS >= 2
+
+
+class SharedBlock:
+    # Column-major float64 copy of a 2-D block that several map_columns calls
+    # can use in turn. When the block is large enough for the process
+    # backend it lives in shared memory, so worker processes map it in place
+    # and the columns are copied once for all the calls; otherwise it is a
+    # plain array. Use it as a context manager so the segment is released.
+
+    def __init__(self, block, backend=None):
+        self.backend = backend or BACKEND
+        columns = list(_columns(block))
+        self.columns = [name for name, _ in columns]
+        self.shape = (len(columns[0][1]) if columns else 0, len(columns))
+        self._shm = None
+        if self.backend == "process" and _parallel(self.shape, self.backend):
+            self._shm = shared_memory.SharedMemory(create=True, size=max(1, self.shape[0] * self.shape[1] * 8))
+            self.array = np.ndarray(self.shape, dtype=np.float64, buffer=self._shm.buf, order="F")
+        else:
+            self.array = np.empty(self.shape, dtype=np.float64, order="F")
+        for j, (_, values) in enumerate(columns):
+            self.array[:, j] = values
+
+    @property
+    def name(self):
+        return self._shm.name if self._shm is not None else None
+
+    def close(self):
+        self.array = None
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _run_shared(name, shape, index, func, column_name, args):
+    shm = shared_memory.SharedMemory(name=name)
+    block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, order="F")
+    try:
+        return func(block[:, index], column_name, *args)
+    finally:
+        del block
+        shm.close()
+
+
+def map_columns(func, block, *args, backend=None):
+    # Calls func(column, name, *args) for every column of a 2-D block and
+    # returns the results in column order. func must be a module-level
+    # function so that worker processes can import it. A SharedBlock is used as it is, so several calls on the same columns copy
+    # them only once.
+    backend = backend or BACKEND
+    shape = block.shape if isinstance(block, SharedBlock) else np.shape(block)
+    if not _parallel(shape, backend):
+        return [func(values, name, *args) for name, values in _columns(block)]
+
+    if backend == "thread":
+        return list(_pool(backend).map(lambda column: func(column[1], column[0], *args), _columns(block)))
+
+    # Workers map the column-major shared block and read their column in
+    # place instead of receiving a pickled copy
+    if isinstance(block, SharedBlock) and block.name is not None:
+        shared = block
+    else:
+        shared = SharedBlock(block, "process")
+    try:
+        pool = _pool(backend)
+        futures = [pool.submit(_run_shared, shared.name, shape, j, func, name, args) for j, name in enumerate(shared.columns)]
+        return [future.result() for future in futures]
+    finally:
+        if shared is not block:
+            shared.close()
+
+
+def _run_batch(name, shape, func, task, args):
+    shm = shared_memory.SharedMemory(name=name)
+    values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    try:
+        return func(values, task, *args)
+    finally:
+        del values
+        shm.close()
+
+
+def map_batches(func, values, tasks, *args, backend=None):
+    # Calls func(values, task, *args) for every task (e.g. a seed and a
+    # number of resamples) and returns the results in task order. The array
+    # is shared by all calls: worker processes map one shared copy of it.
+    backend = backend or BACKEND
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    tasks = list(tasks)
+    if backend == "serial" or values.size * len(tasks) < PARALLEL_MIN_VALUES or len(tasks) < 2 or WORKERS < 2:
+        return [func(values, task, *args) for task in tasks]
+
+    if backend == "thread":
+        return list(_pool(backend).map(lambda task: func(values, task, *args), tasks))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+    try:
+        shared = np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)
+        shared[...] = values
+        del shared
+        pool = _pool(backend)
+        futures = [pool.submit(_run_batch, shm.name, values.shape, func, task, args) for task in tasks]
+        return [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
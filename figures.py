@@ -0,0 +1,284 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+import binning
+import downsample
+
+# Builders for the per-variable charts. The ones taking one column as a
+# NumPy array can be run in worker processes by executor.map_columns.
+
+# Outliers drawn per box; the most extreme ones on each side are kept
+BOX_MAX_OUTLIERS = 100
+
+# Up to this many rows every point is drawn next to its box; above it a
+# random sample of BOX_SAMPLE_POINTS is drawn instead
+BOX_POINTS_MAX_ROWS = 5000
+BOX_SAMPLE_POINTS = 1000
+
+# Scatter plots draw SVG markers up to SCATTER_SVG_MAX_ROWS, WebGL markers
+# up to SCATTER_WEBGL_MAX_ROWS and binned 2-D counts beyond that, so the
+# payload then depends on the number of bins rather than rows
+SCATTER_SVG_MAX_ROWS = 10_000
+SCATTER_WEBGL_MAX_ROWS = 500_000
+SCATTER_BINS = 100
+SCATTER_MATRIX_BINS = 40
+
+
+def box_summary(values, name, points=False, seed=0):
+    # Five-number summary with Tukey fences, a capped set of outliers and,
+    # when points are wanted, the points or a sample of them. Its size does
+    # not depend on the number of rows.
+    values = values[~np.isnan(values)]
+    summary = {"name": name, "n": len(values)}
+    if not len(values):
+        return summary
+
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    inside = values[(values >= low) & (values <= high)]
+    below, above = values[values < low], values[values > high]
+    half = BOX_MAX_OUTLIERS // 2
+    if len(below) > half:
+        below = np.partition(below, half - 1)[:half]
+    if len(above) > half:
+        above = np.partition(above, len(above) - half)[-half:]
+    summary.update(
+        q1=q1, median=median, q3=q3, mean=values.mean(),
+        lowerfence=inside.min(), upperfence=inside.max(),
+        outliers=np.concatenate([below, above]),
+    )
+
+    if points:
+        if len(values) > BOX_POINTS_MAX_ROWS:
+            values = np.random.default_rng(seed).choice(values, BOX_SAMPLE_POINTS, replace=False)
+        summary["points"] = values
+    return summary
+
+
+def sketch_box_summary(sketch, name, mean, steps=200):
+    # Box summary read off a sketches.QuantileSketch, for columns that were
+    # only streamed. The whiskers end at the most extreme grid quantile
+    # inside the Tukey fences; the column minimum and maximum stand in for
+    # the outliers when they fall outside.
+    summary = {"name": name, "n": sketch.n}
+    if not sketch.n:
+        return summary
+
+    grid = sketch.quantile(np.linspace(0.0, 1.0, steps + 1))
+    q1, median, q3 = sketch.quantile([0.25, 0.5, 0.75])
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    inside = grid[(grid >= low) & (grid <= high)]
+    summary.update(
+        q1=q1, median=median, q3=q3, mean=mean,
+        lowerfence=inside.min(), upperfence=inside.max(),
+        outliers=np.array([value for value in (sketch.min, sketch.max) if value < low or value > high]),
+    )
+    return summary
+
+
+def box_figure(summaries, orientation="v", value_title=None, seed=0):
+    # Precomputed box traces, one per summary, at positions 0, 1, ... with
+    # the column names as tick labels. Outliers and sampled points are
+    # separate marker traces, the points jittered around their box.
+    rng = np.random.default_rng(seed)
+    vertical = orientation == "v"
+    fig = go.Figure()
+    for position, summary in enumerate(summaries):
+        if not summary["n"]:
+            continue
+        stats = {key: [summary[key]] for key in ("q1", "median", "q3", "mean", "lowerfence", "upperfence")}
+        if vertical:
+            fig.add_trace(go.Box(x=[position], name=str(summary["name"]), **stats))
+        else:
+            fig.add_trace(go.Box(y=[position], name=str(summary["name"]), orientation="h", **stats))
+
+        for key, jitter in (("outliers", 0.0), ("points", 0.3)):
+            markers = summary.get(key)
+            if markers is None or not len(markers):
+                continue
+            spread = position + rng.uniform(-jitter, jitter, len(markers))
+            x, y = (spread, markers) if vertical else (markers, spread)
+            fig.add_trace(go.Scatter(x=x, y=y, mode="markers", marker=dict(size=3), name=str(summary["name"])))
+
+    ticks = dict(tickvals=list(range(len(summaries))), ticktext=[str(summary["name"]) for summary in summaries])
+    if vertical:
+        fig.update_xaxes(**ticks)
+        fig.update_yaxes(title_text=value_title)
+    else:
+        fig.update_yaxes(**ticks)
+        fig.update_xaxes(title_text=value_title)
+    fig.update_layout(showlegend=False)
+    return fig
+
+
+def histogram_figure(histogram, name):
+    # Drawn from precomputed bin counts, so only the bins reach the browser.
+    # Log bins are drawn as a filled step line, which keeps its shape on a
+    # log axis.
+    edges, counts = histogram.edges, histogram.counts
+    if histogram.log:
+        fig = go.Figure(go.Scatter(x=edges, y=np.append(counts, counts[-1:]), line_shape="hv", fill="tozeroy", mode="lines"))
+        fig.update_xaxes(type="log")
+    else:
+        fig = go.Figure(go.Bar(x=edges[:-1], y=counts, width=np.diff(edges), offset=0))
+    fig.update_layout(bargap=0)
+    fig.update_xaxes(title_text=f"{name} Histogram")
+    fig.update_yaxes(title_text="count")
+    return fig
+
+
+def pie_figure(values, name):
+    # One slice per category from binning.categorize, so the figure holds at
+    # most a few dozen aggregated rows whatever the column size
+    codes, labels = binning.categorize(values)
+    counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+    return px.pie(names=labels, values=counts, labels={"names": f"{name} Pie Chart"})
+
+
+def bar_figure(x, y, x_name, y_name):
+    # Sum of y over each category of x (the height px.bar stacks up from
+    # raw rows), or the row count of each category when y is None
+    codes, labels = binning.categorize(x)
+    valid = codes >= 0
+    weights = None
+    if y is not None:
+        y = np.asarray(y, dtype=np.float64)
+        valid &= ~np.isnan(y)
+        weights = y[valid]
+    heights = np.bincount(codes[valid], weights=weights, minlength=len(labels))
+    return px.bar(x=labels, y=heights, labels={"x": f"{x_name} Bar Chart", "y": y_name if y is not None else "count"})
+
+
+def line_figure(values, name, points=downsample.LINE_POINTS, window=None, method="lttb"):
+    # Only the rows in window (start, stop) are drawn, reduced to at most
+    # `points` points, so zooming into a window shows it at full detail
+    start, stop = window or (0, len(values))
+    x = np.arange(start, stop)
+    reduce = downsample.min_max if method == "min_max" else downsample.lttb
+    x, y = reduce(x, values[start:stop], points)
+    return px.line(x=x, y=y, labels={"x": "index", "y": f"{name} Line Chart"})
+
+
+def _bin_range(values, low, high, bins):
+    # Bin of every value over a fixed range, -1 where missing
+    if not (np.isfinite(low) and np.isfinite(high)):
+        low, high = 0.0, 1.0
+    valid = ~np.isnan(values)
+    width = (high - low) / bins if high > low else 1.0
+    index = np.full(len(values), -1, dtype=np.int64)
+    index[valid] = np.clip(((values[valid] - low) / width).astype(np.int64), 0, bins - 1)
+    return index, low + width * (np.arange(bins) + 0.5)
+
+
+def _bin_index(values, bins):
+    # Bin of every value over the column's range, -1 where missing
+    valid = ~np.isnan(values)
+    low, high = (values[valid].min(), values[valid].max()) if valid.any() else (0.0, 1.0)
+    return _bin_range(values, low, high, bins)
+
+
+def _density(ix, iy, bins):
+    # 2-D counts of two binned columns with one bincount; empty cells are
+    # left blank
+    valid = (ix >= 0) & (iy >= 0)
+    counts = np.bincount(iy[valid] * bins + ix[valid], minlength=bins * bins).reshape(bins, bins)
+    return np.where(counts > 0, counts, np.nan)
+
+
+def scatter_figure(x, y, x_name, y_name):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) <= SCATTER_WEBGL_MAX_ROWS:
+        render_mode = "svg" if len(x) <= SCATTER_SVG_MAX_ROWS else "webgl"
+        return px.scatter(x=x, y=y, labels={"x": x_name, "y": y_name}, render_mode=render_mode)
+
+    ix, x_centres = _bin_index(x, SCATTER_BINS)
+    iy, y_centres = _bin_index(y, SCATTER_BINS)
+    fig = go.Figure(go.Heatmap(x=x_centres, y=y_centres, z=_density(ix, iy, SCATTER_BINS), colorscale="Blues", colorbar=dict(title="count")))
+    fig.update_xaxes(title_text=x_name)
+    fig.update_yaxes(title_text=y_name)
+    return fig
+
+
+def scatter_matrix_figure(block):
+    # Up to SCATTER_WEBGL_MAX_ROWS rows, a scatter matrix of the raw points
+    # (drawn with WebGL); above that, a grid of 2-D count heatmaps with
+    # histograms on the diagonal. Every column is binned once and each pair
+    # is counted with a single bincount.
+    if len(block) <= SCATTER_WEBGL_MAX_ROWS:
+        return px.scatter_matrix(block)
+
+    # Only numeric columns can be binned
+    block = block[[col for col in block.columns if pd.api.types.is_numeric_dtype(block[col])]]
+    x = block.to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(invalid="ignore"):
+        low, high = np.nanmin(x, axis=0, initial=np.inf), np.nanmax(x, axis=0, initial=-np.inf)
+    return binned_scatter_matrix_figure([block], list(block.columns), low, high)
+
+
+def binned_scatter_matrix_figure(chunks, columns, low, high, bins=SCATTER_MATRIX_BINS):
+    # Grid of 2-D count heatmaps with histograms on the diagonal, counted
+    # chunk by chunk over fixed column ranges (e.g. the min and max of a
+    # moments.Moments pass), so the columns can be streamed. Each chunk
+    # bins every column once and counts each pair with a single bincount.
+    names = [str(name) for name in columns]
+    k = len(names)
+    diagonal = np.zeros((k, bins), dtype=np.int64)
+    density = {(row, col): np.zeros((bins, bins), dtype=np.int64) for row in range(k) for col in range(row + 1, k)}
+    centres = [_bin_range(np.empty(0), low[j], high[j], bins)[1] for j in range(k)]
+    for chunk in chunks:
+        binned = [_bin_range(chunk[col].to_numpy(dtype=np.float64, na_value=np.nan), low[j], high[j], bins)[0] for j, col in enumerate(columns)]
+        for row, iy in enumerate(binned):
+            diagonal[row] += np.bincount(iy[iy >= 0], minlength=bins)
+            for col in range(row + 1, k):
+                ix = binned[col]
+                valid = (ix >= 0) & (iy >= 0)
+                density[row, col] += np.bincount(iy[valid] * bins + ix[valid], minlength=bins * bins).reshape(bins, bins)
+
+    fig = make_subplots(rows=k, cols=k, shared_xaxes=True, horizontal_spacing=0.02, vertical_spacing=0.02)
+    for row in range(k):
+        for col in range(k):
+            if row == col:
+                trace = go.Bar(x=centres[col], y=diagonal[row], marker_color="#317EFB")
+            else:
+                # Pairs are counted once; the lower triangle is the transpose
+                counts = density[row, col] if row < col else density[col, row].T
+                trace = go.Heatmap(x=centres[col], y=centres[row], z=np.where(counts > 0, counts, np.nan), colorscale="Blues", showscale=False)
+            fig.add_trace(trace, row=row + 1, col=col + 1)
+        fig.update_yaxes(title_text=names[row], row=row + 1, col=1)
+    for col in range(k):
+        fig.update_xaxes(title_text=names[col], row=k, col=col + 1)
+    fig.update_layout(showlegend=False, bargap=0, height=max(400, 150 * k))
+    return fig
+
+
+def correlation_heatmap(r, order=None):
+    # Correlation matrix as a heatmap on a fixed -1..1 scale, rows and
+    # columns in the given order
+    order = list(r.index) if order is None else order
+    names = [str(name) for name in order]
+    r = r.loc[order, order]
+    fig = go.Figure(go.Heatmap(x=names, y=names, z=r.to_numpy(), zmin=-1, zmax=1, colorscale="RdBu", reversescale=True, colorbar=dict(title="r")))
+    fig.update_yaxes(autorange="reversed")
+    fig.update_layout(height=max(400, min(1200, 20 * len(names))))
+    return fig
+
+
+def matrix_heatmap(matrix, colorbar_title=None):
+    # Heatmap of a labelled square matrix, coloured around zero
+    names = [str(name) for name in matrix.index]
+    fig = go.Figure(go.Heatmap(x=names, y=names, z=matrix.to_numpy(), zmid=0, colorscale="RdBu", reversescale=True, colorbar=dict(title=colorbar_title)))
+    fig.update_yaxes(autorange="reversed")
+    fig.update_layout(height=max(400, min(1200, 20 * len(names))))
+    return fig
+
+
+def pvalue_curve_figure(mu, pvalue, current=None, alpha=0.05):
+    fig = px.line(x=mu, y=pvalue, labels={"x": "Population Mean (mu)", "y": "P-value"})
+    fig.add_hline(y=alpha, line_dash="dot", line_color="gray")
+    if current is not None:
+        fig.add_vline(x=current, line_dash="dash", line_color="red")
+    return fig
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2, f, rankdata
+
+
+class GroupSums:
+    # Count, mean and sum of squared deviations (M2) of a value column for
+    # every group of a grouping column. Each chunk is reduced with bincounts
+    # over its group codes and merged into the running totals with Chan's
+    # pairwise formulas, so no per-group arrays are built and chunks can come
+    # from a stream or from separate workers.
+
+    def __init__(self):
+        self.groups = pd.Index([])
+        self.n = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+
+    @classmethod
+    def from_block(cls, values, groups):
+        result = cls()
+        values = np.asarray(values, dtype=np.float64)
+        codes, uniques = pd.factorize(pd.Series(groups))
+        keep = (codes >= 0) & ~np.isnan(values)
+        codes, values = codes[keep], values[keep]
+        k = len(uniques)
+        n = np.bincount(codes, minlength=k).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(n > 0, np.bincount(codes, weights=values, minlength=k) / n, 0.0)
+        present = n > 0
+        result.groups = pd.Index(uniques)[present]
+        result.n = n[present]
+        result.mean = mean[present]
+        result.m2 = np.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=k)[present]
+        return result
+
+    def update(self, values, groups):
+        return self.merge(GroupSums.from_block(values, groups))
+
+    def merge(self, other):
+        # Groups new to this accumulator are appended with zero counts first
+        new = other.groups.difference(self.groups, sort=False) if len(self.groups) else other.groups
+        if len(new):
+            self.groups = self.groups.append(new) if len(self.groups) else new
+            self.n = np.concatenate([self.n, np.zeros(len(new))])
+            self.mean = np.concatenate([self.mean, np.zeros(len(new))])
+            self.m2 = np.concatenate([self.m2, np.zeros(len(new))])
+        idx = self.groups.get_indexer(other.groups)
+
+        na, nb = self.n[idx], other.n
+        n = na + nb
+        delta = other.mean - self.mean[idx]
+        self.m2[idx] = self.m2[idx] + other.m2 + delta * delta * na * nb / n
+        self.mean[idx] = self.mean[idx] + delta * nb / n
+        self.n[idx] = n
+        return self
+
+    def variance(self, ddof=1):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n > ddof, self.m2 / (self.n - ddof), np.nan)
+
+    def to_frame(self):
+        return pd.DataFrame(
+            {"count": self.n.astype(np.int64), "mean": self.mean, "std": np.sqrt(self.variance())},
+            index=self.groups,
+        )
+
+
+def from_chunks(chunks, value, group):
+    result = GroupSums()
+    for chunk in chunks:
+        result.update(chunk[value].to_numpy(dtype=np.float64, na_value=np.nan), chunk[group].to_numpy())
+    return result
+
+
+def one_way_anova(sums):
+    # Classic F test from the group counts, means and M2
+    k = len(sums.n)
+    total = sums.n.sum()
+    grand = (sums.n * sums.mean).sum() / total if total else np.nan
+    between = (sums.n * (sums.mean - grand) ** 2).sum()
+    within = sums.m2.sum()
+    df1, df2 = k - 1, total - k
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stat = (between / df1) / (within / df2) if df1 > 0 and df2 > 0 else np.nan
+    return stat, df1, df2, f.sf(stat, df1, df2)
+
+
+def welch_anova(sums):
+    # Welch's F test, which does not assume equal variances. Groups with
+    # fewer than two values carry no variance and are left out.
+    keep = sums.n > 1
+    n, mean, var = sums.n[keep], sums.mean[keep], sums.variance()[keep]
+    k = len(n)
+    if k < 2:
+        return np.nan, np.nan, np.nan, np.nan
+    with np.errstate(invalid="ignore", divide="ignore"):
+        w = n / var
+        weighted = (w * mean).sum() / w.sum()
+        a = (w * (mean - weighted) ** 2).sum() / (k - 1)
+        tmp = ((1 - w / w.sum()) ** 2 / (n - 1)).sum()
+        stat = a / (1 + 2 * (k - 2) / (k * k - 1) * tmp)
+        df2 = (k * k - 1) / (3 * tmp)
+    return stat, k - 1, df2, f.sf(stat, k - 1, df2)
+
+
+def kruskal_wallis(values, groups):
+    # Kruskal-Wallis H with the tie correction, from one ranking of all
+    # values and rank sums per group by bincount. Ranks need every value at
+    # once, so unlike the F tests this runs on the loaded columns.
+    values = np.asarray(values, dtype=np.float64)
+    codes, uniques = pd.factorize(pd.Series(groups))
+    keep = (codes >= 0) & ~np.isnan(values)
+    codes, values = codes[keep], values[keep]
+    n = np.bincount(codes, minlength=len(uniques)).astype(np.float64)
+    present = n > 0
+    k, total = int(present.sum()), len(values)
+    if k < 2:
+        return np.nan, np.nan, np.nan
+    ranks = rankdata(values)
+    rank_sums = np.bincount(codes, weights=ranks, minlength=len(uniques))[present]
+    h = 12.0 / (total * (total + 1)) * (rank_sums ** 2 / n[present]).sum() - 3 * (total + 1)
+    ties = np.unique(values, return_counts=True)[1].astype(np.float64)
+    correction = 1 - (ties ** 3 - ties).sum() / (total ** 3 - total)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        h = h / correction
+    return h, k - 1, chi2.sf(h, k - 1)
+
+
+def summary_table(sums, values, groups):
+    # All three tests in one table
+    rows = []
+    stat, df1, df2, p = one_way_anova(sums)
+    rows.append(("One-way ANOVA", "F", stat, df1, df2, p))
+    stat, df1, df2, p = welch_anova(sums)
+    rows.append(("Welch's ANOVA", "F", stat, df1, df2, p))
+    stat, df1, p = kruskal_wallis(values, groups)
+    rows.append(("Kruskal-Wallis", "H", stat, df1, np.nan, p))
+    return pd.DataFrame(rows, columns=["test", "statistic_type", "statistic", "df_1", "df_2", "p_value"]).set_index("test")
@@ -0,0 +1,377 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+# "c" parses with the default pandas parser into NumPy columns, "pyarrow"
+# parses with Arrow's multithreaded reader into Arrow-backed columns.
+ENGINE = os.environ.get("SIGMASTAT_CSV_ENGINE", "c")
+
+# Arrow-parsed uploads are written once to a columnar copy and memory-mapped
+# on later loads. Feather is mapped without copying; Parquet is smaller on
+# disk but has to be decoded.
+SPILL_DIR = os.environ.get("SIGMASTAT_SPILL_DIR", os.path.join(tempfile.gettempdir(), "sigmastat"))
+SPILL_FORMAT = os.environ.get("SIGMASTAT_SPILL_FORMAT", "feather")
+SPILL_MAX_BYTES = 20 * 1024 ** 3
+
+# Compaction downcasts numeric columns to the narrowest type that holds every
+# value exactly and stores strings as categoricals when at most
+# CATEGORY_MAX_RATIO of the values are distinct.
+COMPACT = os.environ.get("SIGMASTAT_COMPACT", "0") == "1"
+CATEGORY_MAX_RATIO = 0.5
+
+# Parsed frames are kept per server process, so reruns and page switches
+# reuse them instead of parsing the upload again.
+CACHE_MAX_ENTRIES = 8
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# Rows parsed up front to list the columns and preview the upload
+SAMPLE_ROWS = 1000
+_samples = OrderedDict()
+
+# Rows per block when a column is processed in a single streaming pass
+CHUNK_ROWS = 1_000_000
+
+# Results derived from an upload (statistics, figures) are kept per
+# fingerprint, so reruns that only change a parameter reuse them.
+DERIVED_MAX_ENTRIES = 64
+_derived = OrderedDict()
+
+# Streamlit hands out a new UploadedFile on every rerun, but the file_id stays
+# the same, so the content hash only has to be computed once per upload.
+_fingerprints = OrderedDict()
+
+
+def fingerprint(uploaded_file):
+    file_id = getattr(uploaded_file, "file_id", None)
+    if file_id is not None:
+        with _cache_lock:
+            if file_id in _fingerprints:
+                _fingerprints.move_to_end(file_id)
+                return _fingerprints[file_id]
+
+    digest = hashlib.blake2b(digest_size=16)
+    if hasattr(uploaded_file, "getbuffer"):
+        with uploaded_file.getbuffer() as view:
+            digest.update(view)
+    else:
+        with open(uploaded_file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    key = digest.hexdigest()
+
+    if file_id is not None:
+        with _cache_lock:
+            _fingerprints[file_id] = key
+            while len(_fingerprints) > 4 * CACHE_MAX_ENTRIES:
+                _fingerprints.popitem(last=False)
+    return key
+
+
+def _frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _evict():
+    # Least recently used frames go first; the newest entry always stays.
+    total = sum(size for _, size, _ in _cache.values())
+    while len(_cache) > 1 and (len(_cache) > CACHE_MAX_ENTRIES or total > CACHE_MAX_BYTES):
+        _, (_, size, _) = _cache.popitem(last=False)
+        total -= size
+        _cache_stats["evictions"] += 1
+
+
+def _narrowest_int(lo, hi):
+    candidates = (np.uint8, np.uint16, np.uint32) if lo >= 0 else (np.int8, np.int16, np.int32)
+    for dtype in candidates:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return None
+
+
+def _compact_series(series):
+    dtype = series.dtype
+    is_arrow = isinstance(dtype, pd.ArrowDtype)
+
+    def as_dtype(target):
+        return pd.ArrowDtype(pa.from_numpy_dtype(target)) if is_arrow else target
+
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        itemsize = dtype.pyarrow_dtype.bit_width // 8 if is_arrow else dtype.itemsize
+
+    if pd.api.types.is_integer_dtype(dtype):
+        if series.count() == 0:
+            return series
+        target = _narrowest_int(series.min(), series.max())
+        if target is None or target.itemsize >= itemsize:
+            return series
+        return series.astype(as_dtype(target))
+
+    if pd.api.types.is_float_dtype(dtype):
+        if itemsize <= 4:
+            return series
+        narrow = series.astype(as_dtype(np.dtype(np.float32)))
+        # Only when every value survives the round trip unchanged
+        if narrow.astype(dtype).equals(series):
+            return narrow
+        return series
+
+    if pd.api.types.is_string_dtype(dtype) or dtype == object:
+        if len(series) and series.nunique(dropna=False) <= CATEGORY_MAX_RATIO * len(series):
+            return series.astype("category")
+    return series
+
+
+def compact_frame(df):
+    # Returns the compacted frame and its memory use before and after
+    before = _frame_bytes(df)
+    compacted = pd.DataFrame({col: _compact_series(df[col]) for col in df.columns}, index=df.index)
+    return compacted, {"before": before, "after": _frame_bytes(compacted)}
+
+
+def _rewind(uploaded_file):
+    if hasattr(uploaded_file, "seek"):
+        uploaded_file.seek(0)
+    return uploaded_file
+
+
+def spill_path(key, fmt=None):
+    fmt = fmt or SPILL_FORMAT
+    return os.path.join(SPILL_DIR, f"{key}.{fmt}")
+
+
+def _prune_spill_dir():
+    # Oldest copies go first. Mapped files stay readable after unlinking.
+    # Other threads and server processes prune the same directory, so a file
+    # may be gone by the time it is looked at or removed.
+    entries = []
+    for name in os.listdir(SPILL_DIR):
+        path = os.path.join(SPILL_DIR, name)
+        if name.endswith((".feather", ".parquet", ".f32")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries[:-1]:
+        if total <= SPILL_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _write_spill(table, path, fmt):
+    os.makedirs(SPILL_DIR, exist_ok=True)
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if fmt == "parquet":
+        pq.write_table(table, partial)
+    else:
+        # Uncompressed so that the file can be mapped without decoding
+        feather.write_feather(table, partial, compression="uncompressed")
+    os.replace(partial, path)
+    _prune_spill_dir()
+
+
+def _read_spill(path, fmt, columns=None):
+    if fmt == "parquet":
+        return pq.read_table(path, columns=columns, memory_map=True)
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def _ensure_spill(uploaded_file, key):
+    fmt = SPILL_FORMAT
+    path = spill_path(key, fmt)
+    if not os.path.exists(path):
+        table = pa_csv.read_csv(
+            _rewind(uploaded_file),
+            read_options=pa_csv.ReadOptions(use_threads=True),
+        )
+        _write_spill(table, path, fmt)
+        del table
+    return path, fmt
+
+
+def _open_spill(uploaded_file, key, columns):
+    # The copy can be pruned by another session between the existence check
+    # and the mapping; it is then written again once
+    try:
+        return _read_spill(*_ensure_spill(uploaded_file, key), columns)
+    except FileNotFoundError:
+        return _read_spill(*_ensure_spill(uploaded_file, key), columns)
+
+
+def _read_arrow(uploaded_file, key, columns):
+    return _open_spill(uploaded_file, key, columns).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_header(uploaded_file, sample_rows=None):
+    # Only the header and the first rows are parsed, enough to list the
+    # columns and preview the data before anything is selected.
+    sample_rows = sample_rows or SAMPLE_ROWS
+    sample_key = (fingerprint(uploaded_file), sample_rows)
+    with _cache_lock:
+        if sample_key in _samples:
+            _samples.move_to_end(sample_key)
+            return _samples[sample_key]
+
+    sample = pd.read_csv(_rewind(uploaded_file), nrows=sample_rows)
+
+    with _cache_lock:
+        _samples[sample_key] = sample
+        while len(_samples) > CACHE_MAX_ENTRIES:
+            _samples.popitem(last=False)
+    return sample
+
+
+def read_columns(uploaded_file, columns=None, engine=None, compact=None):
+    # Columns are parsed on first use and added to the cached frame for the
+    # upload, so unselected columns never take up memory. The returned frame
+    # is shared between sessions and must not be modified.
+    engine = engine or ENGINE
+    compact = COMPACT if compact is None else compact
+    key = fingerprint(uploaded_file)
+    cache_key = (key, engine, compact)
+    if columns is None:
+        columns = list(read_header(uploaded_file).columns)
+    elif not columns:
+        return pd.DataFrame()
+    else:
+        columns = list(columns)
+
+    with _cache_lock:
+        cached = _cache[cache_key][0] if cache_key in _cache else None
+        missing = [col for col in columns if cached is None or col not in cached.columns]
+        if not missing:
+            _cache.move_to_end(cache_key)
+            _cache_stats["hits"] += 1
+            return cached[columns]
+        _cache_stats["misses"] += 1
+
+    if engine == "pyarrow":
+        loaded = _read_arrow(uploaded_file, key, missing)
+    else:
+        loaded = pd.read_csv(_rewind(uploaded_file), usecols=missing, engine=engine)
+    raw = loaded
+    if compact:
+        loaded, _ = compact_frame(raw)
+
+    with _cache_lock:
+        # Another session may have added columns in the meantime, so merge
+        # into whatever is cached now. The old frame is replaced, not changed.
+        cached, size, raw_size = _cache.get(cache_key, (None, 0, 0))
+        if cached is None:
+            new_cols = list(loaded.columns)
+            df = loaded
+        else:
+            new_cols = [col for col in loaded.columns if col not in cached.columns]
+            df = pd.concat([cached, loaded[new_cols]], axis=1) if new_cols else cached
+        size += _frame_bytes(loaded[new_cols])
+        raw_size += _frame_bytes(raw[new_cols])
+        _cache[cache_key] = (df, size, raw_size)
+        _cache.move_to_end(cache_key)
+        _evict()
+    return df[columns]
+
+
+def read_csv(uploaded_file, engine=None, compact=None):
+    return read_columns(uploaded_file, None, engine, compact)
+
+
+def iter_chunks(uploaded_file, columns, chunksize=None, engine=None, compact=None, dtype=None):
+    # Yields the columns in blocks of rows. Columns that are already cached
+    # are sliced without copying; otherwise the CSV (or its Arrow copy) is
+    # streamed, so the full columns are never held in memory at once.
+    # Streamed CSV chunks infer their types one by one, so a column can come
+    # through as numbers in one chunk and strings in the next; dtype (e.g.
+    # str) is passed to the parser to fix it. Cached and Arrow columns were
+    # typed from the whole file and are left as they are.
+    chunksize = chunksize or CHUNK_ROWS
+    engine = engine or ENGINE
+    compact = COMPACT if compact is None else compact
+    key = fingerprint(uploaded_file)
+    columns = list(columns)
+
+    with _cache_lock:
+        entry = _cache.get((key, engine, compact))
+        cached = entry[0] if entry is not None else None
+    if cached is not None and all(col in cached.columns for col in columns):
+        block = cached[columns]
+        for start in range(0, len(block), chunksize):
+            yield block.iloc[start:start + chunksize]
+        return
+
+    if engine == "pyarrow":
+        for batch in _open_spill(uploaded_file, key, columns).to_batches(max_chunksize=chunksize):
+            yield batch.to_pandas(types_mapper=pd.ArrowDtype)
+        return
+
+    reader = pd.read_csv(_rewind(uploaded_file), usecols=columns, engine=engine, chunksize=chunksize, dtype=dtype)
+    with reader:
+        for chunk in reader:
+            yield chunk[columns]
+
+
+def cached(uploaded_file, name, compute):
+    # compute() is called once per upload and name; the result is shared
+    # between sessions and must not be modified
+    key = (fingerprint(uploaded_file), name)
+    with _cache_lock:
+        if key in _derived:
+            _derived.move_to_end(key)
+            return _derived[key]
+
+    value = compute()
+
+    with _cache_lock:
+        _derived[key] = value
+        while len(_derived) > DERIVED_MAX_ENTRIES:
+            _derived.popitem(last=False)
+    return value
+
+
+def cache_info():
+    with _cache_lock:
+        info = dict(_cache_stats)
+        info["entries"] = len(_cache)
+        info["bytes"] = sum(size for _, size, _ in _cache.values())
+        info["raw_bytes"] = sum(raw_size for _, _, raw_size in _cache.values())
+    return info
+
+
+def cache_summary():
+    info = cache_info()
+    summary = (
+        f"CSV cache: {info['hits']} hits, {info['misses']} misses, "
+        f"{info['entries']} frames ({info['bytes'] / 1024 ** 2:.1f} MB"
+    )
+    if info["raw_bytes"] != info["bytes"]:
+        summary += f", {info['raw_bytes'] / 1024 ** 2:.1f} MB before compaction"
+    return summary + ")"
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        _samples.clear()
+        _derived.clear()
+        _fingerprints.clear()
+        for name in _cache_stats:
+            _cache_stats[name] = 0
@@ -1,7 +1,10 @@
 import streamlit as st
-import pandas as pd
-from scipy.stats import shapiro
-import plotly.express as px
+import executor
+import figures
+import ingest
+import moments
+import normality
+import sketches
 
 def create_navbar():
     st.markdown(
@@ -51,10 +54,38 @@ def select_variables(df):
     selected_vars = st.sidebar.multiselect("Select Variables for Analysis", df.columns)
     return selected_vars
 
-def generate_report(df, selected_vars):
+def generate_report(uploaded_file, selected_vars, approximate=False):
     # Display box Plot with heading "Normality Testing"
     st.subheader("Normality Testing")
-    fig = px.box(df[selected_vars], title="")
+    # The exact path needs the raw columns, so they are loaded (and cached)
+    # first and the streamed passes below slice them; the approximate path
+    # never holds a whole column
+    if not approximate:
+        df = ingest.read_columns(uploaded_file, selected_vars)
+
+    # Count, mean, spread and shape of every variable in one pass over the
+    # rows. In approximate mode the same pass feeds quantile and frequency
+    # sketches, which give the quartiles, the modes and the box plot instead
+    # of sorting and counting each column.
+    column_moments = moments.Moments(selected_vars)
+    column_sketches = sketches.sketch_columns(selected_vars) if approximate else {}
+    for chunk in ingest.iter_chunks(uploaded_file, selected_vars):
+        column_moments.update(chunk)
+        sketches.update_columns(column_sketches, chunk)
+    summary = column_moments.to_frame()
+
+    # Performing normality checks. Shapiro-Wilk needs the raw values; in
+    # approximate mode the D'Agostino-Pearson test on the streamed moments is
+    # used instead.
+    if approximate:
+        box_summaries = [figures.sketch_box_summary(column_sketches[var].quantiles, var, summary.loc[var, "mean"]) for var in selected_vars]
+        normality_results = normality.moment_tests(column_moments)
+    else:
+        # One shared copy of the columns serves every per-column analysis
+        with executor.SharedBlock(df[selected_vars]) as block:
+            box_summaries = executor.map_columns(figures.box_summary, block)
+            normality_results = normality.test_columns(block)
+    fig = figures.box_figure(box_summaries)
     fig.update_layout(
         showlegend=False,
         margin=dict(l=10, r=10, b=10, t=10),
@@ -68,13 +99,17 @@ def generate_report(df, selected_vars):
     st.plotly_chart(fig)
     st.write("")  # Add an empty line to separate plots
 
-    # Performing normality checks and displaying results
+    # Displaying the normality results
     for var in selected_vars:
         st.subheader(f"Variable: {var}")
 
-        # Perform Shapiro-Wilk test for normality
-        _, p_value = shapiro(df[var])
-        st.write(f"Shapiro-Wilk p-value for {var}: {p_value}")
+        # Test for normality, from the batch results
+        if approximate:
+            p_value = normality_results.loc[var, "dagostino_p"]
+            st.write(f"D'Agostino-Pearson p-value for {var} (streamed): {p_value}")
+        else:
+            p_value = normality_results.loc[var, "shapiro_p"]
+            st.write(f"{normality.describe_shapiro(normality_results, var)}: {p_value}")
 
         # Interpret normality test results
         if p_value > 0.05:
@@ -86,14 +121,20 @@ def generate_report(df, selected_vars):
     st.subheader("Descriptive Statistics")
     for var in selected_vars:
         st.write(f"{var}:")
-        st.write(f"Mean: {df[var].mean()}")
-        st.write(f"Median: {df[var].median()}")
-        st.write(f"Mode: {df[var].mode().iloc[0]}")
+        st.write(f"Mean: {summary.loc[var, 'mean']}")
+        if approximate:
+            quantiles = column_sketches[var].quantiles
+            mode = column_sketches[var].mode()
+            st.write(f"Median: {quantiles.median()} (rank error ±{quantiles.rank_error:.2%})")
+            st.write(f"Mode: {mode.value} ({mode.method})")
+        else:
+            st.write(f"Median: {df[var].median()}")
+            st.write(f"Mode: {df[var].mode().iloc[0]}")
         st.write("")  # Add an empty line between variables
 
-def perform_analysis(df, selected_vars, analysis_performed):
+def perform_analysis(uploaded_file, selected_vars, analysis_performed, approximate=False):
     if st.button("Perform Analysis") and not analysis_performed:
-        generate_report(df, selected_vars)
+        generate_report(uploaded_file, selected_vars, approximate)
         return True
     return analysis_performed
 
@@ -106,16 +147,18 @@ def main():
     uploaded_file = upload_csv_file()
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        display_spreadsheet(df)
+        sample = ingest.read_header(uploaded_file)
+        display_spreadsheet(sample)
 
-        selected_vars = select_variables(df)
+        selected_vars = select_variables(sample)
+        approximate = st.sidebar.checkbox("Approximate quantiles")
+        st.sidebar.caption(ingest.cache_summary())
 
         # Track if analysis has been performed
         analysis_performed = st.session_state.get('analysis_performed', False)
 
         if selected_vars:
-            analysis_performed = perform_analysis(df, selected_vars, analysis_performed)
+            analysis_performed = perform_analysis(uploaded_file, selected_vars, analysis_performed, approximate)
 
             if analysis_performed:
                 st.success("Analysis has been performed!")
@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+
+
+def _as_block(block):
+    if isinstance(block, pd.DataFrame):
+        return block.to_numpy(dtype=np.float64, na_value=np.nan)
+    block = np.asarray(block, dtype=np.float64)
+    return block.reshape(-1, 1) if block.ndim == 1 else block
+
+
+class Moments:
+    # Count, mean, central moments M2..M4, min and max for a block of
+    # columns. Each update is one vectorised pass over a chunk, and partial
+    # results combine exactly with the pairwise formulas of Pebay (2008), so
+    # chunks can be processed in any order or on different workers.
+
+    def __init__(self, columns):
+        k = len(columns)
+        self.columns = list(columns)
+        self.n = np.zeros(k)
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.m3 = np.zeros(k)
+        self.m4 = np.zeros(k)
+        self.min = np.full(k, np.inf)
+        self.max = np.full(k, -np.inf)
+
+    @classmethod
+    def from_block(cls, block, columns=None):
+        if columns is None:
+            columns = list(block.columns) if isinstance(block, pd.DataFrame) else None
+        x = _as_block(block)
+        if columns is None:
+            columns = list(range(x.shape[1]))
+        result = cls(columns)
+
+        valid = ~np.isnan(x)
+        n = valid.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nansum(x, axis=0) / n
+        d = np.where(valid, x - mean, 0.0)
+        d2 = d * d
+        result.n = n
+        result.mean = np.where(n > 0, mean, 0.0)
+        result.m2 = d2.sum(axis=0)
+        result.m3 = (d2 * d).sum(axis=0)
+        result.m4 = (d2 * d2).sum(axis=0)
+        if x.shape[0]:
+            result.min = np.where(valid, x, np.inf).min(axis=0)
+            result.max = np.where(valid, x, -np.inf).max(axis=0)
+        return result
+
+    def update(self, block):
+        return self.merge(Moments.from_block(block, self.columns))
+
+    def merge(self, other):
+        na, nb = self.n, other.n
+        n = na + nb
+        safe_n = np.where(n > 0, n, 1.0)
+        delta = other.mean - self.mean
+        delta2 = delta * delta
+
+        mean = self.mean + delta * nb / safe_n
+        m2 = self.m2 + other.m2 + delta2 * na * nb / safe_n
+        m3 = (
+            self.m3 + other.m3
+            + delta2 * delta * na * nb * (na - nb) / safe_n ** 2
+            + 3.0 * delta * (na * other.m2 - nb * self.m2) / safe_n
+        )
+        m4 = (
+            self.m4 + other.m4
+            + delta2 * delta2 * na * nb * (na * na - na * nb + nb * nb) / safe_n ** 3
+            + 6.0 * delta2 * (na * na * other.m2 + nb * nb * self.m2) / safe_n ** 2
+            + 4.0 * delta * (na * other.m3 - nb * self.m3) / safe_n
+        )
+
+        self.n, self.mean, self.m2, self.m3, self.m4 = n, mean, m2, m3, m4
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        return self
+
+    def variance(self, ddof=1):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n > ddof, self.m2 / (self.n - ddof), np.nan)
+
+    def std(self, ddof=1):
+        return np.sqrt(self.variance(ddof))
+
+    def skewness(self):
+        # Biased estimator, as scipy.stats.skew with its defaults
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.n) * self.m3 / self.m2 ** 1.5
+
+    def kurtosis(self):
+        # Biased excess kurtosis, as scipy.stats.kurtosis with its defaults
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.n * self.m4 / self.m2 ** 2 - 3.0
+
+    def to_frame(self):
+        return pd.DataFrame(
+            {
+                "count": self.n,
+                "mean": np.where(self.n > 0, self.mean, np.nan),
+                "std": self.std(),
+                "min": np.where(self.n > 0, self.min, np.nan),
+                "max": np.where(self.n > 0, self.max, np.nan),
+                "skewness": self.skewness(),
+                "kurtosis": self.kurtosis(),
+            },
+            index=self.columns,
+        )
+
+
+def from_chunks(chunks, columns=None):
+    result = None
+    for chunk in chunks:
+        part = Moments.from_block(chunk, columns)
+        result = part if result is None else result.merge(part)
+    if result is None:
+        result = Moments(columns or [])
+    return result
+
+
+class CoMoments:
+    # Pairwise counts, means and co-moments (sums of cross products of
+    # deviations) for every pair of columns, the streaming counterpart of
+    # DataFrame.cov(). Each pair only uses rows where both columns are
+    # present: mean[i, j] is the mean of column i over the rows shared with
+    # column j. Chunks are folded in with one set of matrix products and
+    # partial accumulators merge exactly, so workers, files or appended rows
+    # can be combined without re-reading anything.
+
+    def __init__(self, columns):
+        k = len(columns)
+        self.columns = list(columns)
+        self.n = np.zeros((k, k))
+        self.mean = np.zeros((k, k))
+        self.comoment = np.zeros((k, k))
+
+    @classmethod
+    def from_block(cls, block, columns=None):
+        if columns is None:
+            columns = list(block.columns) if isinstance(block, pd.DataFrame) else None
+        x = _as_block(block)
+        if columns is None:
+            columns = list(range(x.shape[1]))
+        result = cls(columns)
+        k = x.shape[1]
+        if not len(x):
+            return result
+
+        # Shifting by the chunk means keeps the cross products small; the
+        # co-moments do not depend on the shift
+        valid = ~np.isnan(x)
+        count = valid.sum(axis=0)
+        shift = np.where(valid, x, 0.0).sum(axis=0) / np.maximum(count, 1)
+        z = np.where(valid, x - shift, 0.0)
+        if valid.all():
+            n = np.full((k, k), float(len(x)))
+            sums = np.broadcast_to(z.sum(axis=0)[:, None], (k, k))
+        else:
+            m = valid.astype(np.float64)
+            n = m.T @ m
+            # sums[i, j]: sum of column i over the rows shared with column j
+            sums = z.T @ m
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(n > 0, sums / n, 0.0)
+            comoment = z.T @ z - np.where(n > 0, sums * sums.T / n, 0.0)
+        result.n = n
+        result.mean = mean + shift[:, None]
+        result.comoment = comoment
+        return result
+
+    def update(self, block):
+        return self.merge(CoMoments.from_block(block, self.columns))
+
+    def merge(self, other):
+        na, nb = self.n, other.n
+        n = na + nb
+        safe_n = np.where(n > 0, n, 1.0)
+        delta = other.mean - self.mean
+        self.comoment = self.comoment + other.comoment + delta * delta.T * na * nb / safe_n
+        self.mean = self.mean + delta * nb / safe_n
+        self.n = n
+        return self
+
+    def covariance(self, ddof=1):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n > ddof, self.comoment / (self.n - ddof), np.nan)
+
+    def to_frame(self, ddof=1):
+        return pd.DataFrame(self.covariance(ddof), index=self.columns, columns=self.columns)
+
+
+def comoments_from_chunks(chunks, columns=None):
+    result = None
+    for chunk in chunks:
+        part = CoMoments.from_block(chunk, columns)
+        result = part if result is None else result.merge(part)
+    if result is None:
+        result = CoMoments(columns or [])
+    return result
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+from scipy.special import log_ndtr
+from scipy.stats import chi2, shapiro
+
+import executor
+import moments
+
+# Shapiro-Wilk p-values are only reliable up to this many rows; larger
+# columns are tested on a seeded random subsample of this size.
+SHAPIRO_MAX_ROWS = 5000
+
+
+def _skew_z(n, g1):
+    # D'Agostino's transformation of the sample skewness, as scipy.stats.skewtest
+    y = g1 * np.sqrt((n + 1) * (n + 3) / (6.0 * (n - 2)))
+    beta2 = 3.0 * (n ** 2 + 27 * n - 70) * (n + 1) * (n + 3) / ((n - 2.0) * (n + 5) * (n + 7) * (n + 9))
+    w2 = -1 + np.sqrt(2 * (beta2 - 1))
+    delta = 1 / np.sqrt(0.5 * np.log(w2))
+    alpha = np.sqrt(2.0 / (w2 - 1))
+    y = np.where(y == 0, 1, y)
+    return delta * np.log(y / alpha + np.sqrt((y / alpha) ** 2 + 1))
+
+
+def _kurtosis_z(n, b2):
+    # Anscombe and Glynn's transformation of the sample kurtosis, as
+    # scipy.stats.kurtosistest
+    mean = 3.0 * (n - 1) / (n + 1)
+    var = 24.0 * n * (n - 2) * (n - 3) / ((n + 1) * (n + 1.0) * (n + 3) * (n + 5))
+    x = (b2 - mean) / np.sqrt(var)
+    sqrt_beta1 = 6.0 * (n * n - 5 * n + 2) / ((n + 7) * (n + 9)) * np.sqrt(6.0 * (n + 3) * (n + 5) / (n * (n - 2) * (n - 3)))
+    a = 6.0 + 8.0 / sqrt_beta1 * (2.0 / sqrt_beta1 + np.sqrt(1 + 4.0 / sqrt_beta1 ** 2))
+    term1 = 1 - 2 / (9.0 * a)
+    denom = 1 + x * np.sqrt(2 / (a - 4.0))
+    term2 = np.sign(denom) * np.where(denom == 0.0, np.nan, ((1 - 2.0 / a) / np.abs(denom)) ** (1 / 3.0))
+    return (term1 - term2) / np.sqrt(2 / (9.0 * a))
+
+
+def moment_tests(summary):
+    # D'Agostino-Pearson and Jarque-Bera tests need only the count, skewness
+    # and kurtosis, so they run on a moments.Moments accumulator, including
+    # one built from streamed chunks
+    n = summary.n
+    g1 = summary.skewness()
+    g2 = summary.kurtosis()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        k2 = _skew_z(n, g1) ** 2 + _kurtosis_z(n, g2 + 3.0) ** 2
+        k2 = np.where(n >= 8, k2, np.nan)
+        jb = n / 6.0 * (g1 ** 2 + g2 ** 2 / 4.0)
+    return pd.DataFrame(
+        {
+            "n": n.astype(np.int64),
+            "dagostino_stat": k2,
+            "dagostino_p": chi2.sf(k2, 2),
+            "jarque_bera_stat": jb,
+            "jarque_bera_p": chi2.sf(jb, 2),
+        },
+        index=summary.columns,
+    )
+
+
+# The upper-tail formula has its minimum at this A^2 and rises after it; the
+# p-value there is already far below any practical level
+ANDERSON_MAX_A2 = 153.0
+
+
+def _anderson_p(a2):
+    # D'Agostino and Stephens (1986), case of estimated mean and variance.
+    # np.select evaluates every branch, so overflow in the unused ones is
+    # silenced.
+    with np.errstate(over="ignore", invalid="ignore"):
+        p = np.select(
+            [a2 > ANDERSON_MAX_A2, a2 >= 0.6, a2 >= 0.34, a2 >= 0.2],
+            [
+                0.0,
+                np.exp(1.2937 - 5.709 * a2 + 0.0186 * a2 ** 2),
+                np.exp(0.9177 - 4.279 * a2 - 1.38 * a2 ** 2),
+                1 - np.exp(-8.318 + 42.796 * a2 - 59.938 * a2 ** 2),
+            ],
+            1 - np.exp(-13.436 + 101.14 * a2 - 223.73 * a2 ** 2),
+        )
+    return np.clip(p, 0.0, 1.0)
+
+
+def anderson_darling(x):
+    # Anderson-Darling statistic (small-sample adjusted) against a normal
+    # with estimated mean and variance, for every column of a 2-D block at
+    # once. Missing values are sorted to the end of each column and masked
+    # out.
+    x = np.sort(x, axis=0)
+    valid = ~np.isnan(x)
+    n = valid.sum(axis=0).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(x, axis=0) / n
+        std = np.sqrt(np.nansum((x - mean) ** 2, axis=0) / (n - 1))
+        z = (x - mean) / std
+        i = np.arange(1, x.shape[0] + 1, dtype=np.float64)[:, None]
+        terms = (2 * i - 1) * log_ndtr(z) + (2 * n + 1 - 2 * i) * log_ndtr(-z)
+        a2 = -n - np.where(valid, terms, 0.0).sum(axis=0) / n
+        a2 = a2 * (1 + 0.75 / n + 2.25 / n ** 2)
+    a2 = np.where(n >= 8, a2, np.nan)
+    return a2, _anderson_p(a2)
+
+
+def _shapiro_column(values, name, seed):
+    values = values[~np.isnan(values)]
+    if len(values) > SHAPIRO_MAX_ROWS:
+        values = np.random.default_rng(seed).choice(values, SHAPIRO_MAX_ROWS, replace=False)
+    if len(values) < 3:
+        return np.nan, np.nan, len(values)
+    stat, p_value = shapiro(values)
+    return stat, p_value, len(values)
+
+
+def test_columns(block, seed=0):
+    # Normality statistics for every column of a frame. Shapiro-Wilk runs
+    # on the whole column up to SHAPIRO_MAX_ROWS values and on a seeded
+    # subsample beyond that; the moment and Anderson-Darling tests are
+    # vectorised across all columns and always use every value.
+    # An executor.SharedBlock is used in place, so the worker processes
+    # read the copy the caller already made
+    if isinstance(block, executor.SharedBlock):
+        x, columns = block.array, block.columns
+    else:
+        x, columns = block.to_numpy(dtype=np.float64, na_value=np.nan), list(block.columns)
+        block = x
+    result = moment_tests(moments.Moments.from_block(x, columns))
+    result["anderson_stat"], result["anderson_p"] = anderson_darling(x)
+
+    shapiro_results = executor.map_columns(_shapiro_column, block, seed)
+    result["shapiro_stat"], result["shapiro_p"], result["shapiro_n"] = zip(*shapiro_results)
+    return result
+
+
+def describe_shapiro(result, var):
+    # Label for the Shapiro-Wilk p-value of one column, naming the
+    # subsample when one was used
+    if result.loc[var, "shapiro_n"] < result.loc[var, "n"]:
+        return f"Shapiro-Wilk p-value for {var} (random subsample of {result.loc[var, 'shapiro_n']} rows)"
+    return f"Shapiro-Wilk p-value for {var}"
@@ -1,7 +1,11 @@
 import streamlit as st
-import pandas as pd
-from scipy.stats import ttest_rel, shapiro
-import plotly.express as px
+import numpy as np
+import executor
+import figures
+import ingest
+import normality
+import resampling
+import ttests
 
 def create_navbar():
     st.markdown(
@@ -51,12 +55,25 @@ def select_variables(df):
     selected_vars = st.sidebar.multiselect("Select Paired Variables for Paired t-test", df.columns)
     return selected_vars
 
-def perform_paired_t_test(df, selected_vars, test_performed):
+def perform_batch_t_tests(df, selected_vars, test_performed):
+    correction = st.sidebar.selectbox("Multiple-comparison Correction", ttests.CORRECTIONS)
+    if st.button("Perform Batch Paired t-tests") and not test_performed:
+        # Every pair in one vectorised pass, with corrected p-values
+        results = ttests.pairwise_paired(df[selected_vars], correction)
+
+        st.subheader("Batch Paired t-test Results")
+        st.write(f"{int(results['significant'].sum())} of {len(results)} comparisons are significant at 0.05 after {correction} correction.")
+        st.dataframe(results, height=400)
+        return True
+    return test_performed
+
+def perform_paired_t_test(uploaded_file, df, selected_vars, test_performed):
     if st.button("Perform Paired t-test") and not test_performed:
         if len(selected_vars) == 2:
             # Display box plots for selected variables
             st.subheader("Box Plots for Selected Variables")
-            fig = px.box(df, x=selected_vars, points="all", labels={var: f"{var} Boxplot" for var in selected_vars})
+            box_summaries = executor.map_columns(figures.box_summary, df[selected_vars], True)
+            fig = figures.box_figure(box_summaries, orientation="h")
             fig.update_layout(
                 showlegend=False,
                 margin=dict(l=10, r=10, b=10, t=10),
@@ -73,12 +90,14 @@ def perform_paired_t_test(df, selected_vars, test_performed):
             # Display normality testing before t-test
             st.subheader("Normality Testing")
 
+            # Normality tests for all variables in one batch
+            normality_results = normality.test_columns(df[selected_vars])
             for var in selected_vars:
                 st.subheader(f"Variable: {var}")
 
-                # Shapiro-Wilk test for normality
-                _, p_value = shapiro(df[var])
-                st.write(f"Shapiro-Wilk p-value for {var}: {p_value}")
+                # Shapiro-Wilk test for normality, from the batch results
+                p_value = normality_results.loc[var, "shapiro_p"]
+                st.write(f"{normality.describe_shapiro(normality_results, var)}: {p_value}")
 
                 # Interpret normality test results
                 if p_value > 0.05:
@@ -86,8 +105,9 @@ def perform_paired_t_test(df, selected_vars, test_performed):
                 else:
                     st.write(f"{var} does not appear to be normally distributed.")
 
-            # Perform paired t-test
-            result = ttest_rel(df[selected_vars[0]], df[selected_vars[1]])
+            # Perform paired t-test from the count, mean and variance of the
+            # differences, gathered in one streamed pass
+            result = ttests.paired_chunks(ingest.iter_chunks(uploaded_file, selected_vars), selected_vars[0], selected_vars[1])
 
             # Display t-test results
             st.subheader("Paired t-test Results")
@@ -99,6 +119,15 @@ def perform_paired_t_test(df, selected_vars, test_performed):
             else:
                 st.write("No significant difference observed between the paired variables.")
 
+            # Resampling tests when either variable fails the normality test
+            if (normality_results["shapiro_p"] <= 0.05).any():
+                st.subheader("Resampling Results (non-normal data)")
+                differences = df[selected_vars[0]].to_numpy(dtype=np.float64, na_value=np.nan) - df[selected_vars[1]].to_numpy(dtype=np.float64, na_value=np.nan)
+                flip = resampling.sign_flip_test(differences)
+                st.write(f"Sign-flip test P-value: {flip.pvalue} ({flip.resamples} resamples)")
+                low, high = resampling.percentile_interval(resampling.bootstrap_means(differences))
+                st.write(f"Bootstrap 95% CI for the mean difference: ({low}, {high})")
+
             # Display statistical summary table
             st.subheader("Statistical Summary Table")
             summary_table = df[selected_vars].describe().transpose()
@@ -119,16 +148,24 @@ def main():
     uploaded_file = upload_csv_file()
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        display_spreadsheet(df)
+        sample = ingest.read_header(uploaded_file)
+        display_spreadsheet(sample)
 
-        selected_vars = select_variables(df)
+        selected_vars = select_variables(sample)
+        df = ingest.read_columns(uploaded_file, selected_vars)
+        st.sidebar.caption(ingest.cache_summary())
 
         # Track if paired t-test has been performed
         test_performed = st.session_state.get('test_performed', False)
 
-        if selected_vars:
-            test_performed = perform_paired_t_test(df, selected_vars, test_performed)
+        if selected_vars and len(selected_vars) > 2:
+            test_performed = perform_batch_t_tests(df, selected_vars, test_performed)
+
+            if test_performed:
+                st.success("Batch paired t-tests have been performed!")
+
+        elif selected_vars:
+            test_performed = perform_paired_t_test(uploaded_file, df, selected_vars, test_performed)
 
             if test_performed:
                 st.success("Paired t-test has been performed!")
@@ -0,0 +1,157 @@
+import math
+from collections import namedtuple
+
+import numpy as np
+
+import executor
+
+# Resamples per batch are chosen so that one batch draws about this many
+# random values; batches are spread over the executor's workers
+BATCH_VALUES = 4_000_000
+
+# Batches per round. The p-value is checked after every round, and the
+# number per round is fixed so results do not depend on the worker count.
+ROUND_BATCHES = 8
+
+# Permutation and sign-flip tests stop once the Monte-Carlo standard error
+# of the p-value is below TOLERANCE, or the p-value is more than
+# SETTLED_ERRORS standard errors away from alpha, but not before
+# MIN_RESAMPLES resamples
+MIN_RESAMPLES = 1000
+MAX_RESAMPLES = 100_000
+TOLERANCE = 0.001
+SETTLED_ERRORS = 4
+
+BOOTSTRAP_RESAMPLES = 2000
+
+ResamplingResult = namedtuple("ResamplingResult", ["statistic", "pvalue", "resamples", "stderr"])
+
+
+def _batch_size(n, most=None):
+    size = max(1, BATCH_VALUES // max(n, 1))
+    return size if most is None else min(size, most)
+
+
+def _seeds(seed):
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+
+def _tasks(seeds, size, remaining, batches):
+    sizes = [s for s in (min(size, remaining - i * size) for i in range(batches)) if s > 0]
+    return list(zip(seeds.spawn(len(sizes)), sizes))
+
+
+def _beyond(resampled, observed):
+    # Resampled statistics at least as extreme as the observed one, allowing
+    # for rounding in the sums
+    return int((np.abs(resampled) >= abs(observed) * (1 - 1e-9)).sum())
+
+
+def _permutation_batch(values, task, n1, observed):
+    # Group 1 of each resample is the n1 smallest of n random keys, i.e. a
+    # uniformly random subset
+    seed, size = task
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    keys = rng.random((size, n), dtype=np.float32)
+    chosen = np.argpartition(keys, n1 - 1, axis=1)[:, :n1]
+    s1 = values[chosen].sum(axis=1)
+    return _beyond(s1 / n1 - (values.sum() - s1) / (n - n1), observed)
+
+
+def _sign_flip_batch(values, task, observed):
+    # Random signs come eight to a byte; the flipped sums are one matrix
+    # product
+    seed, size = task
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    bits = np.unpackbits(rng.integers(0, 256, (size, (n + 7) // 8), dtype=np.uint8), axis=1, count=n)
+    signs = bits.astype(np.float64) * 2 - 1
+    return _beyond(signs @ values, observed)
+
+
+def sequential(func, values, args, alpha=0.05, max_resamples=MAX_RESAMPLES, seed=0):
+    # Runs rounds of batches until the p-value is precise enough or settled
+    # on one side of alpha. func(values, (seed, size), *args) draws `size`
+    # resamples and returns how many are at least as extreme as observed;
+    # returns the p-value, the resamples drawn and the Monte-Carlo standard
+    # error.
+    seeds = _seeds(seed)
+    # Rounds hold at most MIN_RESAMPLES resamples, so small samples can stop
+    # after the first
+    size = _batch_size(len(values), -(-MIN_RESAMPLES // ROUND_BATCHES))
+    count = done = 0
+    p = se = np.nan
+    while done < max_resamples:
+        tasks = _tasks(seeds, size, max_resamples - done, ROUND_BATCHES)
+        count += sum(executor.map_batches(func, values, tasks, *args))
+        done += sum(s for _, s in tasks)
+        p = (count + 1) / (done + 1)
+        se = math.sqrt(p * (1 - p) / done)
+        if done >= MIN_RESAMPLES and (se <= TOLERANCE or abs(p - alpha) > SETTLED_ERRORS * se):
+            break
+    return p, done, se
+
+
+def permutation_test(x, y, alpha=0.05, max_resamples=MAX_RESAMPLES, seed=0):
+    # Two-sided permutation test of the difference in means of two
+    # independent samples
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    x, y = x[~np.isnan(x)], y[~np.isnan(y)]
+    if not len(x) or not len(y):
+        return ResamplingResult(np.nan, np.nan, 0, np.nan)
+    observed = x.mean() - y.mean()
+    pooled = np.concatenate([x, y])
+    # Centred so the group sums stay small
+    pooled -= pooled.mean()
+    p, done, se = sequential(_permutation_batch, pooled, (len(x), observed), alpha, max_resamples, seed)
+    return ResamplingResult(observed, p, done, se)
+
+
+def sign_flip_test(differences, mu=0.0, alpha=0.05, max_resamples=MAX_RESAMPLES, seed=0):
+    # Two-sided sign-flip test that paired differences (or one sample) are
+    # symmetric about mu
+    d = np.asarray(differences, dtype=np.float64)
+    d = d[~np.isnan(d)] - mu
+    if not len(d):
+        return ResamplingResult(np.nan, np.nan, 0, np.nan)
+    p, done, se = sequential(_sign_flip_batch, d, (d.sum(),), alpha, max_resamples, seed)
+    return ResamplingResult(d.mean() + mu, p, done, se)
+
+
+def _bootstrap_batch(values, task):
+    seed, size = task
+    rng = np.random.default_rng(seed)
+    return values[rng.integers(0, len(values), (size, len(values)))].mean(axis=1)
+
+
+def bootstrap_means(values, resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    # Means of `resamples` bootstrap resamples of one sample
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return np.full(resamples, np.nan)
+    seeds = _seeds(seed)
+    size = _batch_size(len(values))
+    tasks = _tasks(seeds, size, resamples, -(-resamples // size))
+    return np.concatenate(executor.map_batches(_bootstrap_batch, values, tasks))
+
+
+def bootstrap_mean_difference(x, y, resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    # Bootstrap distribution of mean(x) - mean(y), resampling each sample
+    # on its own
+    first, second = np.random.SeedSequence(seed).spawn(2)
+    return bootstrap_means(x, resamples, first) - bootstrap_means(y, resamples, second)
+
+
+def percentile_interval(resampled, confidence=0.95):
+    return tuple(np.nanquantile(resampled, [(1 - confidence) / 2, (1 + confidence) / 2]))
+
+
+def bootstrap_pvalue(resampled, observed, null=0.0):
+    # Two-sided p-value of the shifted bootstrap distribution: how often a
+    # resampled estimate strays from the observed one by at least as much
+    # as the observed one strays from the null
+    resampled = resampled[~np.isnan(resampled)]
+    return (np.sum(np.abs(resampled - observed) >= abs(observed - null)) + 1) / (len(resampled) + 1)
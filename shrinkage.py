@@ -0,0 +1,218 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import ingest
+
+ESTIMATORS = ["ledoit-wolf", "oas"]
+
+# From this many columns, or with no more rows than columns, the sample
+# covariance is singular or too large to show and wide-data mode is used
+WIDE_MIN_COLUMNS = 100
+
+# Values per block of the matrix products; the covariance is computed and
+# written a block of rows at a time
+BLOCK_VALUES = 16_000_000
+
+# A spilled matrix starts with its shrinkage intensity and mu as two float64
+# values, so a later request can reuse it without touching the data
+HEADER_BYTES = 16
+
+
+def _centered(block):
+    # Columns centred on their means. Missing values become zero, i.e. are
+    # replaced by the column mean, which the estimators need as they work on
+    # complete rows.
+    x = block.to_numpy(dtype=np.float64, na_value=np.nan) if isinstance(block, pd.DataFrame) else np.asarray(block, dtype=np.float64)
+    valid = ~np.isnan(x)
+    mean = np.where(valid, x, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    return np.where(valid, x - mean, 0.0)
+
+
+def _gram_norm(x):
+    # Squared Frobenius norm of X'X, from whichever Gram matrix is smaller
+    # (X X' when there are fewer rows than columns); both have the same norm
+    n, p = x.shape
+    total = 0.0
+    if n < p:
+        step = max(1, BLOCK_VALUES // max(n, 1))
+        for start in range(0, n, step):
+            total += float(((x[start:start + step] @ x.T) ** 2).sum())
+    else:
+        step = max(1, BLOCK_VALUES // max(p, 1))
+        for start in range(0, p, step):
+            total += float(((x[:, start:start + step].T @ x) ** 2).sum())
+    return total
+
+
+def is_wide(rows, columns):
+    return columns >= WIDE_MIN_COLUMNS or rows <= columns
+
+
+def shrinkage_intensity(x, method="ledoit-wolf"):
+    # Shrinkage towards mu * I of the covariance S = X'X / n of centred
+    # columns, with the Ledoit-Wolf or oracle approximating (OAS) intensity
+    # as in scikit-learn. Neither needs S itself, only its trace and its
+    # Frobenius norm.
+    n, p = x.shape
+    if n == 0 or p == 0:
+        return 0.0, 0.0
+    x2 = x * x
+    trace = x2.sum() / n
+    mu = trace / p
+    norm2 = _gram_norm(x) / n ** 2
+
+    if method == "oas":
+        alpha = norm2 / p ** 2
+        den = (n + 1) * (alpha - mu ** 2 / p)
+        return (1.0 if den == 0 else min((alpha + mu ** 2) / den, 1.0)), mu
+
+    # Ledoit-Wolf: beta measures how far single-row outer products scatter
+    # around S, delta how far S is from mu * I
+    beta = (float((x2.sum(axis=1) ** 2).sum()) / n - norm2) / (p * n)
+    delta = (norm2 - 2 * mu * trace + p * mu ** 2) / p
+    beta = min(beta, delta)
+    return (0.0 if beta == 0 else beta / delta), mu
+
+
+class PackedCovariance:
+    # Upper triangle of a symmetric p x p matrix in float32, row by row, in a
+    # memory-mapped file: p(p+1)/2 values instead of p^2 float64s. Reads go
+    # through blocks of rows, so the full matrix is never unpacked. The file
+    # is mapped once when opened, so it stays readable if the spill
+    # directory is pruned afterwards.
+
+    def __init__(self, path, columns, shrinkage, mu, method, values=None):
+        self.path = path
+        self.columns = list(columns)
+        self.shrinkage = shrinkage
+        self.mu = mu
+        self.method = method
+        self._values = values
+
+    @classmethod
+    def open(cls, path, columns, method, mapped_path=None):
+        # Raises FileNotFoundError when there is no file (any more)
+        result = cls(mapped_path or path, columns, 0.0, 0.0, method)
+        with open(path, "rb") as f:
+            result.shrinkage, result.mu = np.frombuffer(f.read(HEADER_BYTES), dtype=np.float64)
+            result._values = np.memmap(f, dtype=np.float32, mode="r", offset=HEADER_BYTES, shape=(max(result.size, 1),))
+        return result
+
+    @property
+    def size(self):
+        p = len(self.columns)
+        return p * (p + 1) // 2
+
+    def _offset(self, i):
+        p = len(self.columns)
+        return i * p - i * (i - 1) // 2
+
+    def _row_step(self):
+        return max(1, BLOCK_VALUES // max(len(self.columns), 1))
+
+    def rows(self, start, stop):
+        # Row index, column index and value of every stored entry in rows
+        # start..stop
+        p = len(self.columns)
+        values = self._values
+        lengths = p - np.arange(start, stop)
+        i = np.repeat(np.arange(start, stop), lengths)
+        first = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        j = i + np.arange(lengths.sum()) - first
+        return i, j, np.asarray(values[self._offset(start):self._offset(stop)], dtype=np.float64)
+
+    def diagonal(self):
+        p = len(self.columns)
+        values = self._values
+        return np.asarray(values[[self._offset(i) for i in range(p)]], dtype=np.float64)
+
+    def strongest(self, k=50):
+        # The k largest off-diagonal entries by absolute value, with the
+        # correlation they imply
+        best_i, best_j, best_v = np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+        p = len(self.columns)
+        for start in range(0, p, self._row_step()):
+            i, j, v = self.rows(start, min(p, start + self._row_step()))
+            off = i != j
+            i, j, v = np.concatenate([best_i, i[off]]), np.concatenate([best_j, j[off]]), np.concatenate([best_v, v[off]])
+            if len(v) > k:
+                keep = np.argpartition(-np.abs(v), k)[:k]
+                i, j, v = i[keep], j[keep], v[keep]
+            best_i, best_j, best_v = i, j, v
+        order = np.argsort(-np.abs(best_v), kind="stable")
+        best_i, best_j, best_v = best_i[order], best_j[order], best_v[order]
+        diag = self.diagonal()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            implied = best_v / np.sqrt(diag[best_i] * diag[best_j])
+        return pd.DataFrame({
+            "variable_1": [self.columns[i] for i in best_i],
+            "variable_2": [self.columns[j] for j in best_j],
+            "covariance": best_v,
+            "correlation": implied,
+        })
+
+    def downsample(self, cells=100):
+        # Mean of the matrix over a grid of at most cells x cells blocks of
+        # consecutive columns, for a heatmap of a matrix too large to draw
+        p = len(self.columns)
+        cells = max(1, min(cells, p))
+        sums = np.zeros(cells * cells)
+        counts = np.zeros(cells * cells)
+        for start in range(0, p, self._row_step()):
+            i, j, v = self.rows(start, min(p, start + self._row_step()))
+            gi, gj = i * cells // p, j * cells // p
+            off = i != j
+            # Entries below the diagonal mirror the stored ones
+            index = np.concatenate([gi * cells + gj, (gj * cells + gi)[off]])
+            weights = np.concatenate([v, v[off]])
+            sums += np.bincount(index, weights=weights, minlength=cells * cells)
+            counts += np.bincount(index, minlength=cells * cells)
+        edges = np.arange(cells + 1) * p // cells
+        labels = [f"{self.columns[lo]} .. {self.columns[hi - 1]}" if hi - lo > 1 else str(self.columns[lo]) for lo, hi in zip(edges[:-1], edges[1:])]
+        return pd.DataFrame((sums / np.maximum(counts, 1)).reshape(cells, cells), index=labels, columns=labels)
+
+
+def shrunk_covariance(block, method="ledoit-wolf", key=None):
+    # Shrinkage covariance (1 - s) S + s mu I of a wide block, written to
+    # ingest.SPILL_DIR as a packed float32 upper triangle. Each block of rows
+    # of the triangle is one matrix product against the remaining columns.
+    # With a key (the upload's fingerprint) an existing file for the same
+    # columns and estimator is reused before the data is even centred; if
+    # another session prunes it first, it is computed again.
+    columns = list(block.columns)
+    name = hashlib.blake2b(repr((key, columns, method)).encode(), digest_size=16).hexdigest()
+    path = os.path.join(ingest.SPILL_DIR, f"{name}.shrunk.f32")
+    if key is not None:
+        try:
+            return PackedCovariance.open(path, columns, method)
+        except FileNotFoundError:
+            pass
+
+    x = _centered(block)
+    n, p = x.shape
+    shrinkage, mu = shrinkage_intensity(x, method)
+    result = PackedCovariance(path, columns, shrinkage, mu, method)
+
+    os.makedirs(ingest.SPILL_DIR, exist_ok=True)
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    out = np.memmap(partial, dtype=np.float32, mode="w+", offset=HEADER_BYTES, shape=(max(result.size, 1),))
+    step = result._row_step()
+    for start in range(0, p, step):
+        stop = min(p, start + step)
+        s = (1 - shrinkage) * (x[:, start:stop].T @ x[:, start:]) / max(n, 1)
+        rows = np.arange(stop - start)[:, None]
+        s[rows[:, 0], rows[:, 0]] += shrinkage * mu
+        out[result._offset(start):result._offset(stop)] = s[np.arange(p - start)[None, :] >= rows]
+    out.flush()
+    del out
+    with open(partial, "r+b") as f:
+        f.write(np.array([shrinkage, mu], dtype=np.float64).tobytes())
+    # Mapped before it is moved into place, where it can be pruned
+    result = PackedCovariance.open(partial, columns, method, mapped_path=path)
+    os.replace(partial, path)
+    ingest._prune_spill_dir()
+    return result
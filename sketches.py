@@ -0,0 +1,247 @@
+import math
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+
+# Rank error targeted when approximate quantiles are requested
+DEFAULT_RANK_ERROR = 0.01
+
+# Distinct values tracked per column when estimating the mode
+DEFAULT_CAPACITY = 1024
+
+ModeEstimate = namedtuple("ModeEstimate", ["value", "method", "interval"])
+
+
+# Rank error of a KLL sketch with parameter k, from the empirical fit used by
+# Apache DataSketches (99% confidence, single quantile query).
+def rank_error_for_k(k):
+    return 2.296 / k ** 0.9723
+
+
+def k_for_rank_error(rank_error):
+    return max(8, math.ceil((2.296 / rank_error) ** (1 / 0.9723)))
+
+
+class QuantileSketch:
+    # KLL quantile sketch. Items live in levels of compactors; an item at
+    # level h stands for 2**h input values. A full level is sorted and every
+    # other item (random offset) is promoted, so memory stays near 3k items
+    # whatever the input size. Sketches built on separate chunks merge into
+    # one with the same error bound.
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self._levels = [np.empty(0)]
+        self._compacted = False
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def with_rank_error(cls, rank_error, seed=None):
+        return cls(k_for_rank_error(rank_error), seed)
+
+    @property
+    def rank_error(self):
+        # Exact until the first compaction
+        return rank_error_for_k(self.k) if self._compacted else 0.0
+
+    def _capacity(self, level):
+        depth = len(self._levels) - level - 1
+        return max(2, math.ceil(self.k * (2 / 3) ** depth))
+
+    def _compress(self):
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind at this level
+                paired = len(items) - len(items) % 2
+                keep, promoted = items[paired:], items[:paired][self._rng.integers(2)::2]
+                self._levels[level] = keep
+                self._levels[level + 1] = np.concatenate([self._levels[level + 1], promoted])
+                self._compacted = True
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.n += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError("Only sketches with the same k can be merged.")
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate([self._levels[level], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compacted = self._compacted or other._compacted
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        q = np.asarray(q, dtype=np.float64)
+        if self.n == 0:
+            return np.full(q.shape, np.nan)[()]
+        if not self._compacted:
+            # Every value is still held, so interpolate as np.quantile does
+            return np.quantile(self._levels[0], np.clip(q, 0.0, 1.0))[()]
+        values = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self._levels)])
+        order = np.argsort(values, kind="stable")
+        values, cumulative = values[order], np.cumsum(weights[order])
+        # Smallest retained item whose cumulative weight reaches the rank
+        idx = np.searchsorted(cumulative, q * cumulative[-1], side="left")
+        result = values[np.clip(idx, 0, len(values) - 1)]
+        result = np.where(q <= 0, self.min, np.where(q >= 1, self.max, result))
+        return result[()]
+
+    def median(self):
+        return self.quantile(0.5)
+
+
+class FrequencySketch:
+    # Misra-Gries heavy hitters summary over at most `capacity` distinct
+    # values. Each chunk is counted with np.unique and folded in; when too
+    # many values are tracked, the (capacity + 1)-th largest count is taken
+    # off every count. A stored count is then at most `error` below the true
+    # one, and any value more frequent than n / (capacity + 1) is kept.
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.n = 0
+        self.error = 0
+        self._values = np.empty(0)
+        self._counts = np.empty(0, dtype=np.int64)
+
+    @property
+    def exact(self):
+        return self.error == 0
+
+    def _add(self, values, counts):
+        values = np.concatenate([self._values, values])
+        counts = np.concatenate([self._counts, counts])
+        self._values, inverse = np.unique(values, return_inverse=True)
+        self._counts = np.bincount(inverse.ravel(), weights=counts, minlength=len(self._values)).astype(np.int64)
+        if len(self._counts) > self.capacity:
+            threshold = np.partition(self._counts, len(self._counts) - self.capacity - 1)[len(self._counts) - self.capacity - 1]
+            keep = self._counts > threshold
+            self._values, self._counts = self._values[keep], self._counts[keep] - threshold
+            self.error += int(threshold)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.n += len(values)
+            self._add(*np.unique(values, return_counts=True))
+        return self
+
+    def merge(self, other):
+        self.n += other.n
+        self.error += other.error
+        self._add(other._values, other._counts)
+        return self
+
+    def top_k(self, k=10):
+        # Stored counts are lower bounds; the true count is at most
+        # count + error
+        order = np.argsort(-self._counts, kind="stable")[:k]
+        return pd.DataFrame({
+            "value": self._values[order],
+            "count": self._counts[order],
+            "max_count": self._counts[order] + self.error,
+        })
+
+
+def modal_interval(quantile_sketch, mass=0.1, steps=200):
+    # Shortest interval holding `mass` of the distribution, read off an
+    # evenly spaced grid of quantiles; its midpoint estimates the mode of a
+    # continuous column
+    q = np.linspace(0.0, 1.0, steps + 1)
+    x = quantile_sketch.quantile(q)
+    width = max(1, int(round(mass * steps)))
+    start = int(np.argmin(x[width:] - x[:-width]))
+    return x[start], x[start + width]
+
+
+class ColumnSketch:
+    # The quantile and frequency sketches of one column, fed together
+
+    def __init__(self, rank_error=DEFAULT_RANK_ERROR, capacity=DEFAULT_CAPACITY, seed=0):
+        self.quantiles = QuantileSketch.with_rank_error(rank_error, seed)
+        self.frequencies = FrequencySketch(capacity)
+
+    def update(self, values):
+        self.quantiles.update(values)
+        self.frequencies.update(values)
+        return self
+
+    def merge(self, other):
+        self.quantiles.merge(other.quantiles)
+        self.frequencies.merge(other.frequencies)
+        return self
+
+    def mode(self):
+        # Exact while every distinct value fits in the frequency sketch. Past
+        # that the most frequent tracked value is used if it is a genuine
+        # heavy hitter (its count beats the error bound); otherwise the
+        # column is treated as continuous and the modal interval is used.
+        freq = self.frequencies
+        if freq.n == 0:
+            return ModeEstimate(np.nan, "exact", None)
+        top = freq.top_k(1)
+        if freq.exact:
+            return ModeEstimate(top["value"].iloc[0], "exact", None)
+        if len(top) and top["count"].iloc[0] > freq.error:
+            return ModeEstimate(top["value"].iloc[0], "heavy hitter", None)
+        low, high = modal_interval(self.quantiles)
+        return ModeEstimate((low + high) / 2, "modal interval", (low, high))
+
+
+def exact_summary(values, name=None):
+    # Exact quartiles and mode of one column, the values the sketches
+    # approximate. Ties for the mode go to the smallest value, as in pandas.
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return np.nan, np.nan, np.nan, np.nan
+    q1, q2, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    distinct, counts = np.unique(values, return_counts=True)
+    return q1, q2, q3, distinct[np.argmax(counts)]
+
+
+def sketch_columns(columns, rank_error=DEFAULT_RANK_ERROR, capacity=DEFAULT_CAPACITY, seed=0):
+    # One empty column sketch per column
+    return {col: ColumnSketch(rank_error, capacity, seed) for col in columns}
+
+
+def update_columns(column_sketches, chunk):
+    # Feeds one chunk to the sketch of each of its columns, so the sketches
+    # can share a streamed pass with other accumulators
+    for col, sketch in column_sketches.items():
+        sketch.update(chunk[col].to_numpy(dtype=np.float64, na_value=np.nan))
+    return column_sketches
+
+
+def sketch_chunks(chunks, columns, rank_error=DEFAULT_RANK_ERROR, capacity=DEFAULT_CAPACITY, seed=0):
+    # One column sketch per column, fed chunk by chunk
+    result = sketch_columns(columns, rank_error, capacity, seed)
+    for chunk in chunks:
+        update_columns(result, chunk)
+    return result
@@ -1,7 +1,11 @@
 import streamlit as st
-import pandas as pd
-from scipy.stats import ttest_1samp, shapiro
-import plotly.express as px
+import numpy as np
+import executor
+import figures
+import ingest
+import normality
+import resampling
+import ttests
 
 def create_navbar():
     st.markdown(
@@ -51,59 +55,104 @@ def select_variable(df):
     selected_var = st.sidebar.selectbox("Select a Variable for One-Sample t-test", df.columns)
     return selected_var
 
-def perform_one_sample_t_test(df, selected_var, mu, test_performed):
+def summarize_variable(uploaded_file, df, selected_var):
+    # Everything that does not depend on mu, computed once per upload and
+    # variable: normality tests, box plot, sufficient statistics, p-value
+    # curve and summary table
+    def compute():
+        normality_results = normality.test_columns(df[[selected_var]])
+
+        box_summaries = executor.map_columns(figures.box_summary, df[[selected_var]], True)
+        fig = figures.box_figure(box_summaries, orientation="h", value_title=f"{selected_var} Boxplot")
+        fig.update_layout(
+            showlegend=False,
+            margin=dict(l=10, r=10, b=10, t=10),
+            boxmode='overlay',
+            boxgap=0.5,
+            boxgroupgap=0.3,
+            height=400,  # Adjust the height as needed
+        )
+        fig.update_xaxes(showline=True, linewidth=1, linecolor='black', mirror=True)
+        fig.update_yaxes(showline=True, linewidth=1, linecolor='black', mirror=True)
+
+        # Count, mean and variance gathered in one streamed pass
+        stats = ttests.summarize(ingest.iter_chunks(uploaded_file, [selected_var]), [selected_var])
+        n, mean, var = stats.n[0], stats.mean[0], stats.variance()[0]
+
+        # Bootstrap means for data that fails the normality test; the
+        # bootstrap p-value for any mu is then read off them
+        values = df[selected_var].to_numpy(dtype=np.float64, na_value=np.nan)
+        non_normal = normality_results.loc[selected_var, "shapiro_p"] <= 0.05
+        return {
+            "normality": normality_results,
+            "box": fig,
+            "stats": (n, mean, var),
+            "curve": ttests.pvalue_curve(n, mean, var),
+            "bootstrap": resampling.bootstrap_means(values) if non_normal else None,
+            "summary": df[selected_var].describe().transpose(),
+        }
+
+    return ingest.cached(uploaded_file, ("one-sample t-test", selected_var), compute)
+
+def show_one_sample_t_test(uploaded_file, df, selected_var, mu):
+    summary = summarize_variable(uploaded_file, df, selected_var)
+
+    # Display normality testing before t-test
+    st.subheader("Normality Testing")
+
+    # Shapiro-Wilk test for normality
+    normality_results = summary["normality"]
+    p_value = normality_results.loc[selected_var, "shapiro_p"]
+    st.write(f"{normality.describe_shapiro(normality_results, selected_var)}: {p_value}")
+
+    # Interpret normality test results
+    if p_value > 0.05:
+        st.write(f"{selected_var} appears to be normally distributed.")
+    else:
+        st.write(f"{selected_var} does not appear to be normally distributed.")
+
+    # Box plot for normality visualization
+    st.plotly_chart(summary["box"])
+    st.write("")  # Add an empty line to separate plots
+
+    # Only the t statistic depends on mu
+    result = ttests.one_sample(*summary["stats"], mu)
+
+    # Display t-test results
+    st.subheader("One-Sample t-test Results")
+    st.write(f"T-statistic: {result.statistic}")
+    st.write(f"P-value: {result.pvalue}")
+
+    if result.pvalue < 0.05:
+        st.write(f"The mean of {selected_var} is significantly different from the specified population mean (mu).")
+    else:
+        st.write(f"No significant difference observed between the mean of {selected_var} and the specified population mean (mu).")
+
+    # Resampling results that do not assume normality
+    if summary["bootstrap"] is not None:
+        st.subheader("Bootstrap Results (non-normal data)")
+        low, high = resampling.percentile_interval(summary["bootstrap"])
+        st.write(f"Bootstrap 95% CI for the mean of {selected_var}: ({low}, {high})")
+        st.write(f"Bootstrap P-value: {resampling.bootstrap_pvalue(summary['bootstrap'], summary['stats'][1], mu)}")
+
+    # P-value across a range of mu, with the current mu marked
+    st.plotly_chart(figures.pvalue_curve_figure(*summary["curve"], current=mu))
+
+    # Display statistical summary table
+    st.subheader("Statistical Summary Table")
+    st.table(summary["summary"])
+
+def perform_one_sample_t_test(uploaded_file, df, selected_var, mu, test_performed):
     if st.button("Perform One-Sample t-test") and not test_performed:
         if selected_var:
-            # Display normality testing before t-test
-            st.subheader("Normality Testing")
-
-            # Shapiro-Wilk test for normality
-            _, p_value = shapiro(df[selected_var])
-            st.write(f"Shapiro-Wilk p-value for {selected_var}: {p_value}")
-
-            # Interpret normality test results
-            if p_value > 0.05:
-                st.write(f"{selected_var} appears to be normally distributed.")
-            else:
-                st.write(f"{selected_var} does not appear to be normally distributed.")
-
-            # Box plot for normality visualization
-            fig = px.box(df, x=selected_var, points="all", labels={selected_var: f"{selected_var} Boxplot"})
-            fig.update_layout(
-                showlegend=False,
-                margin=dict(l=10, r=10, b=10, t=10),
-                boxmode='overlay',
-                boxgap=0.5,
-                boxgroupgap=0.3,
-                height=400,  # Adjust the height as needed
-            )
-            fig.update_xaxes(showline=True, linewidth=1, linecolor='black', mirror=True)
-            fig.update_yaxes(showline=True, linewidth=1, linecolor='black', mirror=True)
-            st.plotly_chart(fig)
-            st.write("")  # Add an empty line to separate plots
-
-            # Perform one-sample t-test
-            result = ttest_1samp(df[selected_var], mu)
-            
-            # Display t-test results
-            st.subheader("One-Sample t-test Results")
-            st.write(f"T-statistic: {result.statistic}")
-            st.write(f"P-value: {result.pvalue}")
-
-            if result.pvalue < 0.05:
-                st.write(f"The mean of {selected_var} is significantly different from the specified population mean (mu).")
-            else:
-                st.write(f"No significant difference observed between the mean of {selected_var} and the specified population mean (mu).")
-
-            # Display statistical summary table
-            st.subheader("Statistical Summary Table")
-            summary_table = df[selected_var].describe().transpose()
-            st.table(summary_table)
-
-            return True
+            test_performed = True
         else:
             st.warning("Please select a variable for one-sample t-test.")
             return False
+
+    # Once performed, results stay on the page and follow changes to mu
+    if test_performed and selected_var:
+        show_one_sample_t_test(uploaded_file, df, selected_var, mu)
     return test_performed
 
 def main():
@@ -115,10 +164,12 @@ def main():
     uploaded_file = upload_csv_file()
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        display_spreadsheet(df)
+        sample = ingest.read_header(uploaded_file)
+        display_spreadsheet(sample)
 
-        selected_var = select_variable(df)
+        selected_var = select_variable(sample)
+        df = ingest.read_columns(uploaded_file, [selected_var])
+        st.sidebar.caption(ingest.cache_summary())
 
         # Track if one-sample t-test has been performed
         test_performed = st.session_state.get('test_performed', False)
@@ -127,7 +178,7 @@ def main():
             # Specify the population mean (mu)
             mu = st.sidebar.number_input("Enter the Population Mean (mu)", value=0.0)
 
-            test_performed = perform_one_sample_t_test(df, selected_var, mu, test_performed)
+            test_performed = perform_one_sample_t_test(uploaded_file, df, selected_var, mu, test_performed)
 
             if test_performed:
                 st.success("One-Sample t-test has been performed!")
@@ -0,0 +1,36 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import contingency
+import ingest
+
+
+class Upload(io.BytesIO):
+    file_id = "mixed-dtypes"
+    name = "mix.csv"
+
+
+def test_crosstab_chunks_with_mixed_dtypes():
+    # The first chunk of r holds only 1 and parses as integers, a later one
+    # holds "a" and parses as strings; category 1 must still be one row
+    r = ["1"] * 10 + ["1"] * 5 + ["a"] * 4 + ["1"]
+    c = ["x"] * 15 + ["y"] * 4 + ["y"]
+    data = pd.DataFrame({"r": r, "c": c}).to_csv(index=False).encode()
+    upload = Upload(data)
+
+    chunks = list(ingest.iter_chunks(upload, ["r", "c"], chunksize=10, dtype=str))
+    table = contingency.crosstab_chunks(chunks, "r", "c")
+    expected = pd.crosstab(pd.Series(r, name="r"), pd.Series(c, name="c"))
+    assert table.to_frame().loc[expected.index, expected.columns].to_numpy().tolist() == expected.to_numpy().tolist()
+    assert table.shape == expected.shape
+
+
+def test_crosstab_update_merges_int_and_str_labels():
+    table = contingency.Crosstab()
+    table.update(np.array([1, 1, 2]), np.array(["x", "y", "x"]))
+    table.update(np.array(["1", "2", None], dtype=object), np.array(["x", "x", "y"], dtype=object))
+    assert table.shape == (2, 2)
+    assert table.to_frame().loc["1", "x"] == 2
+    assert table.total == 5
@@ -0,0 +1,222 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy.stats import t
+
+import moments
+
+# Every test takes counts, means and sample variances (ddof=1) rather than
+# raw columns, so it can run on moments.Moments built from streamed chunks
+# or on summaries computed elsewhere. Arguments may be arrays, in which case
+# every element is tested at once.
+TTestResult = namedtuple("TTestResult", ["statistic", "pvalue", "df"])
+
+CORRECTIONS = ["holm", "benjamini-hochberg"]
+
+# Rows per block of the matrix products in the paired tests, bounding the
+# temporary copies to BLOCK_ROWS x columns values
+BLOCK_ROWS = 100_000
+
+
+def _result(diff, se, df):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        statistic = diff / se
+        pvalue = np.where(df > 0, 2 * t.sf(np.abs(statistic), df), np.nan)
+    return TTestResult(statistic[()], pvalue[()], df[()])
+
+
+def one_sample(n, mean, var, mu=0.0):
+    n, mean, var = (np.asarray(a, dtype=np.float64) for a in (n, mean, var))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return _result(mean - mu, np.sqrt(var / n), n - 1)
+
+
+def paired(n, mean_diff, var_diff):
+    # One-sample test of the pairwise differences against zero
+    return one_sample(n, mean_diff, var_diff, 0.0)
+
+
+def welch(n1, mean1, var1, n2, mean2, var2):
+    n1, mean1, var1, n2, mean2, var2 = (np.asarray(a, dtype=np.float64) for a in (n1, mean1, var1, n2, mean2, var2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        v1, v2 = var1 / n1, var2 / n2
+        df = (v1 + v2) ** 2 / (v1 ** 2 / (n1 - 1) + v2 ** 2 / (n2 - 1))
+        return _result(mean1 - mean2, np.sqrt(v1 + v2), df)
+
+
+def student(n1, mean1, var1, n2, mean2, var2):
+    n1, mean1, var1, n2, mean2, var2 = (np.asarray(a, dtype=np.float64) for a in (n1, mean1, var1, n2, mean2, var2))
+    df = n1 + n2 - 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pooled = ((n1 - 1) * var1 + (n2 - 1) * var2) / df
+        return _result(mean1 - mean2, np.sqrt(pooled * (1 / n1 + 1 / n2)), df)
+
+
+def pvalue_curve(n, mean, var, points=201, width=4.0):
+    # Two-sided one-sample p-value over a grid of hypothesised means
+    # spanning `width` standard errors either side of the sample mean
+    se = np.sqrt(var / n) if n > 0 and var > 0 else 1.0
+    mu = np.linspace(mean - width * se, mean + width * se, points)
+    return mu, one_sample(n, mean, var, mu).pvalue
+
+
+def difference_chunks(chunks, first, second, name="difference"):
+    # first - second on the rows where both are present, chunk by chunk
+    for chunk in chunks:
+        a = chunk[first].to_numpy(dtype=np.float64, na_value=np.nan)
+        b = chunk[second].to_numpy(dtype=np.float64, na_value=np.nan)
+        diff = a - b
+        yield pd.DataFrame({name: diff[~np.isnan(diff)]})
+
+
+def summarize(chunks, columns):
+    # Counts, means and variances of columns in one pass over the chunks;
+    # missing values are left out column by column
+    return moments.from_chunks(chunks, columns)
+
+
+def one_sample_chunks(chunks, column, mu=0.0):
+    stats = summarize(chunks, [column])
+    return one_sample(stats.n[0], stats.mean[0], stats.variance()[0], mu)
+
+
+def paired_chunks(chunks, first, second):
+    stats = summarize(difference_chunks(chunks, first, second), ["difference"])
+    return paired(stats.n[0], stats.mean[0], stats.variance()[0])
+
+
+def two_sample_chunks(chunks, first, second, equal_var=False):
+    stats = summarize(chunks, [first, second])
+    test = student if equal_var else welch
+    var = stats.variance()
+    return test(stats.n[0], stats.mean[0], var[0], stats.n[1], stats.mean[1], var[1])
+
+
+def adjust_pvalues(pvalues, method="holm"):
+    # Holm (family-wise error) or Benjamini-Hochberg (false discovery rate)
+    # adjusted p-values, with one sort; missing p-values stay missing and do
+    # not count as tests
+    p = np.asarray(pvalues, dtype=np.float64)
+    adjusted = np.full(p.shape, np.nan)
+    tested = np.flatnonzero(~np.isnan(p))
+    m = len(tested)
+    if not m:
+        return adjusted
+    order = tested[np.argsort(p[tested], kind="stable")]
+    ranked = p[order]
+    rank = np.arange(1, m + 1)
+    if method == "benjamini-hochberg":
+        ranked = np.minimum.accumulate((ranked * m / rank)[::-1])[::-1]
+    else:
+        ranked = np.maximum.accumulate(ranked * (m - rank + 1))
+    adjusted[order] = np.minimum(ranked, 1.0)
+    return adjusted
+
+
+def _pair_table(first, second, n1, n2, mean1, mean2, result, correction, alpha):
+    table = pd.DataFrame({
+        "variable_1": first,
+        "variable_2": second,
+        "n_1": np.asarray(n1, dtype=np.int64),
+        "n_2": np.asarray(n2, dtype=np.int64),
+        "mean_1": mean1,
+        "mean_2": mean2,
+        "difference": np.asarray(mean1) - np.asarray(mean2),
+        "statistic": result.statistic,
+        "df": result.df,
+        "p_value": result.pvalue,
+    })
+    table["p_adjusted"] = adjust_pvalues(table["p_value"], correction)
+    table["significant"] = table["p_adjusted"] < alpha
+    return table.sort_values("p_value", kind="stable", ignore_index=True)
+
+
+def pairwise_welch(block, correction="holm", alpha=0.05):
+    # Welch tests of every pair of columns, each column treated as an
+    # independent sample. Per-column counts, means and variances come from
+    # one pass over the block; all pairs are then tested as arrays.
+    columns = list(block.columns)
+    stats = moments.Moments.from_block(block, columns)
+    var = stats.variance()
+    i, j = np.triu_indices(len(columns), 1)
+    result = welch(stats.n[i], stats.mean[i], var[i], stats.n[j], stats.mean[j], var[j])
+    names = np.array(columns, dtype=object)
+    return _pair_table(names[i], names[j], stats.n[i], stats.n[j], stats.mean[i], stats.mean[j], result, correction, alpha)
+
+
+def pairwise_paired(block, correction="holm", alpha=0.05):
+    # Paired tests of every pair of columns, each on the rows where both are
+    # present. The count, mean and variance of every pair's differences
+    # follow from the matrix products of the (shifted, zero-filled) values
+    # with each other and with the validity mask, accumulated over blocks of
+    # rows so only one block is converted at a time.
+    columns = list(block.columns)
+    k = len(columns)
+
+    def row_blocks():
+        for start in range(0, len(block), BLOCK_ROWS):
+            x = block.iloc[start:start + BLOCK_ROWS].to_numpy(dtype=np.float64, na_value=np.nan)
+            yield x, ~np.isnan(x)
+
+    # Column means, subtracted first to keep the sums of squares accurate
+    total, count = np.zeros(k), np.zeros(k)
+    for x, valid in row_blocks():
+        total += np.where(valid, x, 0.0).sum(axis=0)
+        count += valid.sum(axis=0)
+    shift = total / np.maximum(count, 1)
+
+    n = np.zeros((k, k))
+    # sums[i, j], squares[i, j]: sum and sum of squares of column i over
+    # the rows shared with column j
+    sums = np.zeros((k, k))
+    squares = np.zeros((k, k))
+    cross = np.zeros((k, k))
+    for x, valid in row_blocks():
+        m = valid.astype(np.float64)
+        z = np.where(valid, x - shift, 0.0)
+        n += m.T @ m
+        sums += z.T @ m
+        squares += (z * z).T @ m
+        cross += z.T @ z
+
+    i, j = np.triu_indices(len(columns), 1)
+    n_ij = n[i, j]
+    sum_d = sums[i, j] - sums[j, i]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_d = sum_d / n_ij
+        var_d = (squares[i, j] + squares[j, i] - 2 * cross[i, j] - sum_d * mean_d) / (n_ij - 1)
+        mean1 = sums[i, j] / n_ij + shift[i]
+        mean2 = sums[j, i] / n_ij + shift[j]
+    result = paired(n_ij, mean1 - mean2, var_d)
+    names = np.array(columns, dtype=object)
+    return _pair_table(names[i], names[j], n_ij, n_ij, mean1, mean2, result, correction, alpha)
+
+
+def grouped_welch(block, groups, correction="holm", alpha=0.05):
+    # Welch tests between every pair of groups, for every column. Group
+    # counts, sums and sums of squares come from bincounts over the group
+    # codes; the correction runs over all tests together.
+    codes, levels = pd.factorize(pd.Series(groups), sort=True)
+    k = len(levels)
+    i, j = np.triu_indices(k, 1)
+    levels = np.array([str(level) for level in levels], dtype=object)
+    tables = []
+    for col in block.columns:
+        x = block[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        keep = (codes >= 0) & ~np.isnan(x)
+        c, v = codes[keep], x[keep]
+        n = np.bincount(c, minlength=k).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(c, weights=v, minlength=k) / n
+            var = np.bincount(c, weights=(v - mean[c]) ** 2, minlength=k) / (n - 1)
+        result = welch(n[i], mean[i], var[i], n[j], mean[j], var[j])
+        table = _pair_table(levels[i], levels[j], n[i], n[j], mean[i], mean[j], result, correction, alpha)
+        table.insert(0, "metric", col)
+        tables.append(table)
+    if not tables:
+        return pd.DataFrame()
+    table = pd.concat(tables, ignore_index=True)
+    table["p_adjusted"] = adjust_pvalues(table["p_value"], correction)
+    table["significant"] = table["p_adjusted"] < alpha
+    return table.rename(columns={"variable_1": "group_1", "variable_2": "group_2"}).sort_values("p_value", kind="stable", ignore_index=True)
@@ -1,7 +1,11 @@
 import streamlit as st
-import pandas as pd
-from scipy.stats import ttest_ind, shapiro
-import plotly.express as px
+import numpy as np
+import executor
+import figures
+import ingest
+import normality
+import resampling
+import ttests
 
 def create_navbar():
     st.markdown(
@@ -51,14 +55,36 @@ def select_variables(df):
     selected_vars = st.sidebar.multiselect("Select Two Variables for Unpaired t-test", df.columns)
     return selected_vars
 
-def perform_unpaired_t_test(df, selected_vars, test_performed):
+def select_group_variable(df):
+    # Optional: compare each selected variable between the groups of this
+    # column instead of comparing the variables with each other
+    return st.sidebar.selectbox("Compare Across Groups of", [None] + list(df.columns), format_func=lambda col: "(no grouping)" if col is None else col)
+
+def perform_batch_t_tests(uploaded_file, df, selected_vars, group_var, test_performed):
+    correction = st.sidebar.selectbox("Multiple-comparison Correction", ttests.CORRECTIONS)
+    if st.button("Perform Batch Unpaired t-tests") and not test_performed:
+        # Every pair in one vectorised pass, with corrected p-values
+        if group_var is not None:
+            groups = ingest.read_columns(uploaded_file, [group_var])[group_var].to_numpy()
+            results = ttests.grouped_welch(df[selected_vars], groups, correction)
+        else:
+            results = ttests.pairwise_welch(df[selected_vars], correction)
+
+        st.subheader("Batch Unpaired t-test Results")
+        st.write(f"{int(results['significant'].sum())} of {len(results)} comparisons are significant at 0.05 after {correction} correction.")
+        st.dataframe(results, height=400)
+        return True
+    return test_performed
+
+def perform_unpaired_t_test(uploaded_file, df, selected_vars, test_performed):
     if st.button("Perform Unpaired t-test") and not test_performed:
         if len(selected_vars) == 2:
             # Display normality testing before t-test
             st.subheader("Normality Testing")
 
             # Box plot for normality visualization
-            fig = px.box(df, x=selected_vars, points="all", labels={var: f"{var} Boxplot" for var in selected_vars})
+            box_summaries = executor.map_columns(figures.box_summary, df[selected_vars], True)
+            fig = figures.box_figure(box_summaries, orientation="h")
             fig.update_layout(
                 showlegend=False,
                 margin=dict(l=10, r=10, b=10, t=10),
@@ -72,12 +98,14 @@ def perform_unpaired_t_test(df, selected_vars, test_performed):
             st.plotly_chart(fig)
             st.write("")  # Add an empty line to separate plots
 
+            # Normality tests for all variables in one batch
+            normality_results = normality.test_columns(df[selected_vars])
             for var in selected_vars:
                 st.subheader(f"Variable: {var}")
 
-                # Shapiro-Wilk test for normality
-                _, p_value = shapiro(df[var])
-                st.write(f"Shapiro-Wilk p-value for {var}: {p_value}")
+                # Shapiro-Wilk test for normality, from the batch results
+                p_value = normality_results.loc[var, "shapiro_p"]
+                st.write(f"{normality.describe_shapiro(normality_results, var)}: {p_value}")
 
                 # Interpret normality test results
                 if p_value > 0.05:
@@ -85,8 +113,9 @@ def perform_unpaired_t_test(df, selected_vars, test_performed):
                 else:
                     st.write(f"{var} does not appear to be normally distributed.")
 
-            # Perform unpaired t-test
-            result = ttest_ind(df[selected_vars[0]], df[selected_vars[1]], equal_var=False)
+            # Perform unpaired (Welch) t-test from each variable's count,
+            # mean and variance, gathered in one streamed pass
+            result = ttests.two_sample_chunks(ingest.iter_chunks(uploaded_file, selected_vars), selected_vars[0], selected_vars[1])
             
             # Display t-test results
             st.subheader("Unpaired t-test Results")
@@ -98,6 +127,16 @@ def perform_unpaired_t_test(df, selected_vars, test_performed):
             else:
                 st.write("No significant difference observed between the means of the two selected variables.")
 
+            # Resampling tests when either variable fails the normality test
+            if (normality_results["shapiro_p"] <= 0.05).any():
+                st.subheader("Resampling Results (non-normal data)")
+                first = df[selected_vars[0]].to_numpy(dtype=np.float64, na_value=np.nan)
+                second = df[selected_vars[1]].to_numpy(dtype=np.float64, na_value=np.nan)
+                permutation = resampling.permutation_test(first, second)
+                st.write(f"Permutation test P-value: {permutation.pvalue} ({permutation.resamples} resamples)")
+                low, high = resampling.percentile_interval(resampling.bootstrap_mean_difference(first, second))
+                st.write(f"Bootstrap 95% CI for the difference in means: ({low}, {high})")
+
             # Display statistical summary table
             st.subheader("Statistical Summary Table")
             summary_table = df[selected_vars].describe().transpose()
@@ -118,16 +157,25 @@ def main():
     uploaded_file = upload_csv_file()
 
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        display_spreadsheet(df)
+        sample = ingest.read_header(uploaded_file)
+        display_spreadsheet(sample)
 
-        selected_vars = select_variables(df)
+        selected_vars = select_variables(sample)
+        group_var = select_group_variable(sample)
+        df = ingest.read_columns(uploaded_file, selected_vars)
+        st.sidebar.caption(ingest.cache_summary())
 
         # Track if unpaired t-test has been performed
         test_performed = st.session_state.get('test_performed', False)
 
-        if selected_vars:
-            test_performed = perform_unpaired_t_test(df, selected_vars, test_performed)
+        if selected_vars and (group_var is not None or len(selected_vars) > 2):
+            test_performed = perform_batch_t_tests(uploaded_file, df, selected_vars, group_var, test_performed)
+
+            if test_performed:
+                st.success("Batch unpaired t-tests have been performed!")
+
+        elif selected_vars:
+            test_performed = perform_unpaired_t_test(uploaded_file, df, selected_vars, test_performed)
 
             if test_performed:
                 st.success("Unpaired t-test has been performed!")